@@ -0,0 +1,83 @@
+import argparse
+import itertools
+import os
+import random
+import zipfile
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def make_word(rank):
+    """
+    A distinct lowercase word for every vocabulary rank: a, b, ..., z, aa, ab, ...
+    """
+    word = ""
+    rank += 1
+    while rank:
+        rank, letter = divmod(rank - 1, len(LETTERS))
+        word = LETTERS[letter] + word
+    return word
+
+
+def zipf_cumulative_weights(vocabulary_size, exponent):
+    """
+    Cumulative weights of a Zipfian distribution: the word of rank r has weight 1 / r^exponent.
+    """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, vocabulary_size + 1)))
+
+
+def format_document(docno, words):
+    """
+    A TREC document in the layout of the AP collection, the text split into two <TEXT> sections.
+    """
+    middle = len(words) // 2
+    return (f"<DOC>\n<DOCNO> {docno} </DOCNO>\n<FILEID>SYNTHETIC</FILEID>\n"
+            f"<TEXT>\n{' '.join(words[:middle])}\n</TEXT>\n"
+            f"<HEAD>synthetic</HEAD>\n"
+            f"<TEXT>\n{' '.join(words[middle:])}\n</TEXT>\n</DOC>\n")
+
+
+def generate_corpus(output_dir, num_docs, vocabulary_size=50000, exponent=1.0, doc_length=250,
+                    docs_per_file=500, files_per_zip=20, seed=42):
+    """
+    Write `num_docs` synthetic documents as zipped TREC files under `output_dir`
+    (AP_000.zip, AP_001.zip, ...), with words drawn from a Zipfian vocabulary and
+    document lengths drawn uniformly around `doc_length`.
+
+    Returns the vocabulary, most frequent word first, so benchmarks can pick
+    frequent, medium and rare query terms.
+    """
+    rng = random.Random(seed)
+    vocabulary = [make_word(rank) for rank in range(vocabulary_size)]
+    cumulative_weights = zipf_cumulative_weights(vocabulary_size, exponent)
+    os.makedirs(output_dir, exist_ok=True)
+
+    docs_per_zip = docs_per_file * files_per_zip
+    for zip_number, first_doc in enumerate(range(0, num_docs, docs_per_zip)):
+        zip_path = os.path.join(output_dir, f"AP_{zip_number:03d}.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            last_doc = min(first_doc + docs_per_zip, num_docs)
+            for file_number, file_first in enumerate(range(first_doc, last_doc, docs_per_file)):
+                documents = []
+                for doc in range(file_first, min(file_first + docs_per_file, last_doc)):
+                    length = rng.randint(doc_length // 2, doc_length * 3 // 2)
+                    words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=length)
+                    documents.append(format_document(f"SYN-{doc:08d}", words))
+                zf.writestr(f"ap/syn{zip_number:03d}_{file_number:03d}", "".join(documents))
+    return vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic zipped TREC corpus with a Zipfian vocabulary.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--exponent", type=float, default=1.0, help="Zipf exponent")
+    parser.add_argument("--doc-length", type=int, default=250, help="mean number of words per document")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate_corpus(args.output_dir, args.docs, args.vocabulary, args.exponent, args.doc_length, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from booleanRetrieval import BooleanRetrieval, InvertedIndex
+from corpusGenerator import generate_corpus
+from corpusReader import IngestStats
+from parallelIndexer import build_index
+from postings import memory_report
+
+# RPN templates of the query workloads
+WORKLOADS = {
+    "AND": "{0} {1} AND",
+    "OR": "{0} {1} OR",
+    "NOT": "{0} {1} NOT AND",
+    "AND3": "{0} {1} AND {2} AND",
+    "MIXED": "{0} {1} OR {2} NOT AND",
+}
+# frequent, medium and rare query terms, as ranges of the vocabulary sorted by frequency
+TERM_BANDS = [(0.0, 0.002), (0.002, 0.04), (0.04, 1.0)]
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+def benchmark_ingest(data_dir, workers):
+    index = InvertedIndex(backend="compressed")
+    stats = IngestStats()
+    build_index(index, data_dir, workers=workers, stats=stats)
+    build_seconds = stats.elapsed()
+    start = time.perf_counter()
+    index.optimize()
+    return index, {
+        "workers": workers,
+        "docs": stats.docs,
+        "bytes": stats.bytes,
+        "seconds": build_seconds,
+        "docs_per_sec": stats.docs / build_seconds if build_seconds else 0.0,
+        "mb_per_sec": stats.bytes / 2**20 / build_seconds if build_seconds else 0.0,
+        "optimize_seconds": time.perf_counter() - start,
+    }
+
+
+def benchmark_memory(data_dir):
+    """
+    Memory of a serial build traced with tracemalloc (worker processes are not traced).
+    """
+    tracemalloc.start()
+    index = InvertedIndex(backend="compressed")
+    build_index(index, data_dir, workers=1)
+    build_peak = tracemalloc.get_traced_memory()[1]
+    index.optimize()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report = memory_report(index.index, len(index.doc_ids))
+    return {
+        "index_bytes": current,
+        "build_peak_bytes": build_peak,
+        "peak_bytes": peak,
+        "postings_bytes": report["postings_bytes"],
+        "postings_bytes_per_posting": report["postings_bytes_per_posting"],
+        "term_dictionary_bytes": index.terms.nbytes(),
+        "terms": report["terms"],
+        "postings": report["postings"],
+    }
+
+
+def make_queries(vocabulary, num_queries, rng):
+    """
+    num_queries RPN queries per workload, every term drawn from a random frequency band.
+    """
+    def random_term():
+        low, high = rng.choice(TERM_BANDS)
+        low = min(int(low * len(vocabulary)), len(vocabulary) - 1)
+        return vocabulary[rng.randrange(low, max(int(high * len(vocabulary)), low + 1))]
+    return {name: [template.format(random_term(), random_term(), random_term()) for _ in range(num_queries)]
+            for name, template in WORKLOADS.items()}
+
+
+def benchmark_queries(index, workloads):
+    boolean_retrieval = BooleanRetrieval(index)
+    results = {}
+    for name, queries in workloads.items():
+        for query in queries[:10]:
+            boolean_retrieval.find_matching_documents(query) # warm up
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            boolean_retrieval.find_matching_documents(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        results[name] = {"queries": len(latencies), "mean_ms": sum(latencies) / len(latencies), "max_ms": latencies[-1]}
+        for p in PERCENTILES:
+            results[name][f"p{p}_ms"] = percentile(latencies, p)
+    return results
+
+
+def compare(results, baseline):
+    """
+    Print every metric next to its value in a baseline result file.
+    """
+    def flatten(value, prefix=""):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                yield from flatten(item, f"{prefix}{key}.")
+        elif isinstance(value, list):
+            for item in value:
+                yield from flatten(item, f"{prefix}workers={item.get('workers')}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix[:-1], value
+
+    old = dict(flatten({key: baseline[key] for key in ("ingest", "memory", "queries") if key in baseline}))
+    print(f"{'metric':<45}{'baseline':>14}{'current':>14}{'change':>10}")
+    for metric, value in flatten({key: results[key] for key in ("ingest", "memory", "queries")}):
+        if metric in old and old[metric]:
+            print(f"{metric:<45}{old[metric]:>14.3f}{value:>14.3f}{(value / old[metric] - 1) * 100:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexing throughput, index memory and boolean query latency.")
+    parser.add_argument("--data", help="existing corpus directory (zipped TREC files); a synthetic one is generated otherwise")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--exponent", type=float, default=1.0, help="Zipf exponent of the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200, help="queries per workload")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="index_benchmark.json")
+    parser.add_argument("--baseline", help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data
+        if data_dir is None:
+            data_dir = temp_dir
+            vocabulary = generate_corpus(data_dir, args.docs, args.vocabulary, args.exponent, seed=args.seed)
+
+        ingest = []
+        for workers in sorted({1, args.workers}):
+            index, result = benchmark_ingest(data_dir, workers)
+            ingest.append(result)
+            print(f"ingest workers={workers}: {result['docs_per_sec']:.0f} docs/sec, {result['mb_per_sec']:.2f} MB/sec")
+        memory = benchmark_memory(data_dir)
+        print(f"memory: index {memory['index_bytes'] / 2**20:.1f} MB, peak {memory['peak_bytes'] / 2**20:.1f} MB")
+
+        if args.data is not None:
+            # rank the real vocabulary by document frequency
+            vocabulary = sorted(index.index, key=index.document_frequency, reverse=True)
+        queries = benchmark_queries(index, make_queries(vocabulary, args.queries, random.Random(args.seed)))
+        for name, result in queries.items():
+            print(f"{name:<6} " + ", ".join(f"p{p} {result[f'p{p}_ms']:.3f} ms" for p in PERCENTILES))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "ingest": ingest,
+        "memory": memory,
+        "queries": queries,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from booleanRetrieval import PythonSetOperations
+from numpyPostings import NumpySetOperations, as_array
+
+NUM_DOCS = 1_000_000
+LONG_LENGTH = 200_000
+RATIOS = [1, 10, 100, 1000, 10000]
+
+
+def random_postings(length, rng):
+    return sorted(rng.sample(range(NUM_DOCS), length))
+
+
+def best_time(function, repeat=5):
+    """
+    Fastest of `repeat` runs, in milliseconds.
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    """
+    Compare the pure Python merges with the NumPy backend on AND / OR / AND-NOT / NOT
+    for a long list of LONG_LENGTH doc ids and a short list LONG_LENGTH / ratio long.
+    """
+    rng = random.Random(42)
+    python_ops = PythonSetOperations()
+    numpy_ops = NumpySetOperations()
+    long_list = random_postings(LONG_LENGTH, rng)
+    long_array = as_array(long_list)
+
+    print(f"{'operation':<10}{'ratio':>8}{'short':>9}{'python ms':>12}{'numpy ms':>12}{'speedup':>10}")
+    for ratio in RATIOS:
+        short_list = random_postings(max(LONG_LENGTH // ratio, 1), rng)
+        short_array = as_array(short_list)
+        cases = [
+            ("AND", lambda: python_ops.intersection_many([short_list, long_list]),
+             lambda: numpy_ops.intersection_many([short_array, long_array])),
+            ("OR", lambda: python_ops.union(short_list, long_list),
+             lambda: numpy_ops.union(short_array, long_array)),
+            ("AND-NOT", lambda: python_ops.difference(short_list, long_list),
+             lambda: numpy_ops.difference(short_array, long_array)),
+            ("NOT", lambda: python_ops.not_operator(NUM_DOCS, short_list),
+             lambda: numpy_ops.not_operator(NUM_DOCS, short_array)),
+        ]
+        for name, python_case, numpy_case in cases:
+            assert python_case() == numpy_case().tolist()
+            python_ms = best_time(python_case)
+            numpy_ms = best_time(numpy_case)
+            print(f"{name:<10}{ratio:>8}{len(short_list):>9}{python_ms:>12.2f}{numpy_ms:>12.2f}{python_ms / numpy_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
-from collections import defaultdict
-import re
-import heapq
+from collections import Counter
 import os
-import zipfile
-from tempfile import TemporaryDirectory
+from corpusReader import IngestStats, corpus_fingerprint
+from indexSegment import IndexSegment
+from invertedIndex import InvertedIndex
+from parallelIndexer import build_index
+from postings import CompressedPostings, intersect_blocks, union_blocks, intersect_galloping, intersect_many, difference_galloping, GALLOP_RATIO
+from postings import is_bitmap, bitmap_intersection, bitmap_union, bitmap_difference, bitmap_complement
+from postings import phrase_match, near_match, merge_many
+from numpyPostings import NumpySetOperations
+from resultCache import QueryResultCache
+from queryPlanner import QueryPlanner, Term, Wildcard, Not, And, Or, AndNot, Phrase, Near, iter_nodes
 
 def intersection(listA, listB):
     """
     Returns the intersection of two sorted lists.
     """
+    if is_bitmap(listA) or is_bitmap(listB):
+        return bitmap_intersection(listA, listB)
+
+    if len(listA) > len(listB):
+        listA, listB = listB, listA
+    if len(listB) > GALLOP_RATIO * len(listA):
+        # drive from the short list and skip through the long one
+        return intersect_galloping(listA, listB)
+
+    if isinstance(listA, CompressedPostings) or isinstance(listB, CompressedPostings):
+        # work block by block on the compressed form
+        return intersect_blocks(listA, listB)
+
     results = []
     i, j = 0, 0
 
@@ -24,10 +43,25 @@ def intersection(listA, listB):
 
     return results
 
+def intersection_many(postings_lists):
+    """
+    Returns the intersection of any number of sorted lists,
+    always driving from the shortest list.
+    """
+    return intersect_many(postings_lists)
+
 def union(listA, listB):
     """
     Returns the union of two sorted lists.
     """
+    if is_bitmap(listA) or is_bitmap(listB):
+        # bitwise OR of the two bitsets
+        return bitmap_union(listA, listB)
+
+    if isinstance(listA, CompressedPostings) or isinstance(listB, CompressedPostings):
+        # work block by block on the compressed form
+        return union_blocks(listA, listB)
+
     results = []
     i, j = 0, 0
 
@@ -54,11 +88,52 @@ def union(listA, listB):
 
     return results
 
+def union_many(postings_lists):
+    """
+    Returns the union of any number of sorted lists with one k-way merge.
+    """
+    return merge_many(postings_lists)
+
+def difference(listA, listB):
+    """
+    Returns the elements of sorted list listA that are not in sorted list listB.
+    """
+    if is_bitmap(listA) or is_bitmap(listB):
+        return bitmap_difference(listA, listB)
+
+    if len(listB) > GALLOP_RATIO * len(listA) or isinstance(listA, CompressedPostings) or isinstance(listB, CompressedPostings):
+        return difference_galloping(listA, listB)
+
+    results = []
+    i, j = 0, 0
+
+    while i < len(listA) and j < len(listB):
+        if listA[i] < listB[j]:
+            results.append(listA[i])
+            i += 1
+        elif listA[i] > listB[j]:
+            j += 1
+        else:
+            i += 1
+            j += 1
+
+    # Add remaining elements of listA
+    results.extend(listA[i:])
+
+    return results
+
 def not_operator(num, exclude_list):
     """
     Returns a sorted list of all numbers from 0 to `num` (not including `num`)
     excluding the numbers in `exclude_list`.
     """
+    if is_bitmap(exclude_list):
+        # complement of the bitset, word by word
+        return bitmap_complement(num, exclude_list)
+
+    if isinstance(exclude_list, CompressedPostings):
+        exclude_list = exclude_list.to_list()
+
     results = []
     i = 0
     exclude_len = len(exclude_list)
@@ -72,124 +147,249 @@ def not_operator(num, exclude_list):
 
     return results
 
+def positional_filter(candidates, positions_lists, match):
+    """
+    Returns the candidate doc ids (found in the postings of every term) for which
+    match(positions of each term in the document) holds. The positions of every term
+    are read with one forward cursor over the sorted candidates.
+    """
+    results = []
+    cursors = [positions.positions_of(candidates) for positions in positions_lists]
+    for doc_id, *doc_positions in zip(candidates, *cursors):
+        if match(doc_positions):
+            results.append(doc_id)
+    return results
+
+class PythonSetOperations:
+    """
+    The pure Python merges above, as used by BooleanRetrieval.
+    """
+    def postings(self, index, term):
+        return index.get_postings(term)
+
+    def intersection_many(self, postings_lists):
+        return intersection_many(postings_lists)
+
+    def union(self, listA, listB):
+        return union(listA, listB)
+
+    def union_many(self, postings_lists):
+        return union_many(postings_lists)
+
+    def difference(self, listA, listB):
+        return difference(listA, listB)
+
+    def not_operator(self, num, exclude_list):
+        return not_operator(num, exclude_list)
+
+    def to_list(self, result):
+        return result
+
+SET_OPERATIONS = {"python": PythonSetOperations, "numpy": NumpySetOperations}
+
+class SharedSubexpressions:
+    """
+    Postings of the sub-expressions shared by the queries of a batch.
+    """
+    def __init__(self, keys):
+        self.keys = keys # keys of the sub-expressions that appear more than once
+        self.results = {}
+        self.evaluated = 0
+
+    def get(self, key, node):
+        return self.results.get(key)
+
+    def put(self, key, node, result):
+        self.evaluated += 1
+        if key in self.keys:
+            self.results[key] = result
+
 class BooleanRetrieval:
-    def __init__(self, inverted_index):
+    def __init__(self, inverted_index, cache_bytes=0, backend="python"):
+        """
+        With cache_bytes > 0, query results and intermediate postings are kept in
+        an LRU cache bounded to about that many bytes (see resultCache.py).
+        backend selects the set operations: "python" merges or "numpy" vectorized
+        operations on uint32 arrays (see numpyPostings.py).
+        """
+        if backend not in SET_OPERATIONS:
+            raise ValueError(f"Unknown set operations backend '{backend}'")
         self.inverted_index = inverted_index
+        self.operations = SET_OPERATIONS[backend]()
+        self.planner = QueryPlanner(self.document_frequency, lambda: len(self.inverted_index.doc_ids),
+                                    getattr(inverted_index, "expand_postings", None))
+        self.cache = QueryResultCache(cache_bytes) if cache_bytes > 0 else None
+
+    def document_frequency(self, term):
+        return self.inverted_index.document_frequency(term)
+
+    def current_cache(self):
+        """
+        The result cache, first emptied if the index changed since it was filled
+        (None without a cache). Every path that reads the cache goes through here.
+        """
+        if self.cache is not None:
+            self.cache.check_version(self.inverted_index.version)
+        return self.cache
 
     def find_matching_documents(self, query):
         tokens = query.split()
+        if self.current_cache() is not None:
+            cached = self.cache.results.get(" ".join(tokens))
+            if cached is not None:
+                return cached
+
         result = self.process_query(tokens)
         results = " ".join(map(str, result))
 
+        if self.cache is not None:
+            self.cache.results.put(" ".join(tokens), results)
         return results
 
+    def cache_stats(self):
+        """
+        Hit, miss and eviction counters of the result and postings caches.
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def find_matching_documents_batch(self, queries):
+        """
+        Evaluate a batch of queries together. Every query is planned first, and
+        sub-expressions that appear more than once in the batch (e.g. the same term,
+        or the same "death cancer OR") are evaluated once and their postings shared.
+
+        Returns the results (same format as find_matching_documents) and a dictionary with
+        the number of operations (nodes evaluated, term lookups included) needed without
+        sharing, the number actually evaluated and the number saved.
+        """
+        plans = [self.planner.plan(query.split()) for query in queries]
+
+        # count how many times every sub-expression appears in the batch
+        occurrences = Counter()
+        for plan in plans:
+            if plan is not None:
+                occurrences.update(node.key() for node in iter_nodes(plan))
+        shared = SharedSubexpressions({key for key, count in occurrences.items() if count > 1})
+
+        results = []
+        for plan in plans:
+            doc_ids = self.operations.to_list(self.evaluate(plan, shared)) if plan is not None else []
+            results.append(" ".join(self.inverted_index.convert_from_doc_id_to_name(doc_ids)))
+
+        operations = sum(occurrences.values())
+        stats = {
+            "queries": len(queries),
+            "operations": operations,
+            "evaluated": shared.evaluated,
+            "saved": operations - shared.evaluated,
+        }
+        return results, stats
+
+    def explain(self, query):
+        """
+        Returns the plan chosen for the query with its estimated result sizes and cost.
+        """
+        return self.planner.explain(self.planner.plan(query.split()))
+
     def process_query(self, tokens):
-        stack = []
-        operators = {"AND", "OR", "NOT"}
-
-        for token in tokens:
-            if token not in operators:
-                # Push postings list for the term onto the stack
-                stack.append(self.inverted_index.index[token])
-            elif token == "AND":
-                # Perform intersection
-                list2 = stack.pop()
-                list1 = stack.pop()
-                stack.append(intersection(list1, list2))
-            elif token == "OR":
-                # Perform union
-                list2 = stack.pop()
-                list1 = stack.pop()
-                stack.append(union(list1, list2))
-            elif token == "NOT":
-                # Perform negation
-                list1 = stack.pop()
-                stack.append(not_operator(len(self.inverted_index.doc_ids), list1))
-
-        # The final result should be the only item left in the stack
-        doc_ids = stack.pop() if stack else []
+        # Build the query plan from the RPN tokens and evaluate it
+        plan = self.planner.plan(tokens)
+        doc_ids = self.operations.to_list(self.evaluate(plan, self.current_cache())) if plan is not None else []
 
         return self.inverted_index.convert_from_doc_id_to_name(doc_ids)
 
-class InvertedIndex:
-	def __init__(self):
-		"""
-		Initialize the data structure of the inverted index,
-		implemented as learned at class and described at HW.
-		"""
-		self.index = defaultdict(list) # InvertedIndex data sreucture
-		self.doc_ids = {} # Doc Id (key) to Doc name (value) dictionary
-
-	def add_document(self, text, docno):
-		"""
-		Add a new document to the InvertedIndex structure.
-		"""
-		# add mapping of Document name to Document ID
-		doc_id = len(self.doc_ids)
-		self.doc_ids[doc_id] = docno[0]
-
-		sob = set()
-		# create set of words and add it to data sreucture.
-		for t_section in text:
-			words = t_section.strip()
-			sob = sob.union(set(words.split()))
-		for word in sob:
-			self.index[word].append(doc_id)
-
-	def print(self):
-		"""
-		print inverted index
-		"""
-		for word, docs in sorted(self.index.items()):
-			postings = "-> ".join(f'{idx + 1} ({self.doc_ids[idx]})' for idx in docs)
-			print(f'{word} -> {postings}')
-
-	def get_top_occurrences(self, n):
-		top_occurrences_tokens = heapq.nlargest(n, self.index.keys(), key=lambda k: len(self.index[k]))
-
-		return top_occurrences_tokens
-
-	def get_bottom_occurrences(self, n):
-		bottom_occurrences_tokens = heapq.nsmallest(n, self.index.keys(), key=lambda k: len(self.index[k]))
-
-		return bottom_occurrences_tokens
-
-	def convert_from_doc_id_to_name(self, doc_id_list):
-		results = []
-		for doc_id in doc_id_list:
-			results.append(self.doc_ids[doc_id])
-		return results
+    def evaluate(self, node, shared=None):
+        """
+        Evaluate a query plan node into a sorted postings list.
+        With `shared` (the sub-expressions of a batch, or the cache), the results of
+        repeated sub-expressions are reused.
+        """
+        if shared is None:
+            return self.evaluate_node(node, None)
+        key = node.key()
+        result = shared.get(key, node)
+        if result is not None:
+            return result
+        result = self.evaluate_node(node, shared)
+        shared.put(key, node, result)
+        return result
+
+    def term_positions(self, term):
+        get_positions = getattr(self.inverted_index, "get_positions", None)
+        positions = get_positions(term) if get_positions is not None else None
+        if positions is None:
+            raise ValueError("PHRASE and NEAR/k queries need an InvertedIndex built with positions=True")
+        return positions
+
+    def evaluate_node(self, node, shared):
+        operations = self.operations
+        if isinstance(node, Term):
+            return operations.postings(self.inverted_index, node.term)
+        if isinstance(node, Wildcard):
+            # Merge the postings of every expanded term at once
+            return operations.union_many(node.postings)
+        if isinstance(node, And):
+            # Perform n-way intersection, driven by the shortest list
+            return operations.intersection_many([self.evaluate(child, shared) for child in node.children])
+        if isinstance(node, Or):
+            # Perform union, merging the shortest lists first
+            result = self.evaluate(node.children[0], shared)
+            for child in node.children[1:]:
+                result = operations.union(result, self.evaluate(child, shared))
+            return result
+        if isinstance(node, AndNot):
+            # Perform set difference instead of intersecting with a NOT
+            result = self.evaluate(node.positive, shared)
+            for child in node.negatives:
+                result = operations.difference(result, self.evaluate(child, shared))
+            return result
+        if isinstance(node, (Phrase, Near)):
+            # Intersect the doc ids first, positions are only decoded for the surviving documents
+            candidates = operations.intersection_many([self.evaluate(term, shared) for term in node.terms])
+            positions_lists = [self.term_positions(term.term) for term in node.terms]
+            if isinstance(node, Phrase):
+                match = phrase_match
+            else:
+                match = lambda doc_positions: near_match(doc_positions[0], doc_positions[1], node.distance)
+            return positional_filter(list(operations.to_list(candidates)), positions_lists, match)
+        if isinstance(node, Not):
+            # Perform negation
+            return operations.not_operator(len(self.inverted_index.doc_ids), self.evaluate(node.child, shared))
+        raise TypeError(f"Unknown query plan node {node!r}")
 
 def main():
 
     # Part 1
 
-	index = InvertedIndex()
-
 	curr_dir = os.path.dirname(os.path.abspath(__file__))
 	data_dir = os.path.join(curr_dir, "data")
-
-	if not os.path.exists(data_dir) or not os.path.isdir(data_dir):
-		print("No 'data' folder found")
-		return
-
-	for zip_name in os.listdir(data_dir):
-		zip_path = os.path.join(data_dir, zip_name)
-
-		with TemporaryDirectory() as temp_dir:
-			with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-				zip_ref.extractall(temp_dir)
-
-			for root, _, files in os.walk(temp_dir):
-				for file in files:
-					file_path = os.path.join(root, file)
-					with open(file_path, 'r') as file:
-						fdocs = file.read()
-						docs = fdocs.split(r"<DOC>")
-						for doc in docs[1:]:
-							docno = re.findall(r"<DOCNO> (.*?) </DOCNO>", doc)
-							text = re.findall(r"<TEXT>(.*?)</TEXT>", doc, re.DOTALL)
-							index.add_document(text,docno)
+	segment_dir = os.path.join(curr_dir, "index_segment")
+
+	fingerprint = corpus_fingerprint(data_dir) if os.path.isdir(data_dir) else None
+	index = None
+	if os.path.isdir(segment_dir):
+		# open the saved index, postings are decoded only for the query terms;
+		# it is rebuilt when it is unreadable or was built from another version of the corpus
+		try:
+			index = IndexSegment(segment_dir)
+		except (OSError, ValueError) as error:
+			print(f"Rebuilding the index, the saved one cannot be opened: {error}")
+		else:
+			if fingerprint is not None and index.fingerprint != fingerprint:
+				print("Rebuilding the index, the corpus changed since it was saved")
+				index = None
+	if index is None:
+		if fingerprint is None:
+			print("No 'data' folder found")
+			return
+
+		# stream the documents straight out of the zip files, one worker process per zip
+		index = InvertedIndex(backend="compressed")
+		stats = IngestStats()
+		build_index(index, data_dir, workers=os.cpu_count() or 1, stats=stats)
+		print(stats.report())
+		index.optimize()
+		index.save(segment_dir, fingerprint)
 
     # Part 2
 
@@ -201,10 +401,11 @@ def main():
 	with open(booleanQueries_file_path, "r") as file:
 		boolean_queries = [line.strip() for line in file]
 
-	# Process each query and aggregate results
-	for query in boolean_queries:
-		result = boolean_retrieval.find_matching_documents(query)
+	# Process the queries as one batch, sharing common sub-expressions, and aggregate results
+	batch_results, batch_stats = boolean_retrieval.find_matching_documents_batch(boolean_queries)
+	for result in batch_results:
 		results += result + "\n"  # Append result with a newline
+	print(f"Batch of {batch_stats['queries']} queries: {batch_stats['evaluated']} of {batch_stats['operations']} operations evaluated, {batch_stats['saved']} saved")
 
 	# Write the aggregated results to "Part_2.txt"
 	with open("Part_2.txt", "w") as file:
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import os
+import time
+import zipfile
+
+
+class IngestStats:
+    """
+    Counts the documents and bytes read by the corpus reader to report indexing throughput.
+    """
+    def __init__(self):
+        self.docs = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def docs_per_sec(self):
+        elapsed = self.elapsed()
+        return self.docs / elapsed if elapsed > 0 else 0.0
+
+    def mb_per_sec(self):
+        elapsed = self.elapsed()
+        return self.bytes / 2**20 / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        return (f"Indexed {self.docs} documents ({self.bytes / 2**20:.1f} MB) in {self.elapsed():.1f} sec: "
+                f"{self.docs_per_sec():.0f} docs/sec, {self.mb_per_sec():.2f} MB/sec")
+
+
+def scan_trec_documents(lines):
+    """
+    Single pass scanner over the lines of a TREC file.
+    Yields (docno, text) for every <DOC>, where text is the list of its <TEXT> sections,
+    so only the document being read is kept in memory.
+    """
+    docno = None
+    sections = []
+    buffer = []
+    in_text = False
+
+    for line in lines:
+        pos = 0
+        while pos < len(line):
+            if in_text:
+                end = line.find("</TEXT>", pos)
+                if end == -1:
+                    buffer.append(line[pos:])
+                    break
+                buffer.append(line[pos:end])
+                sections.append("".join(buffer))
+                buffer = []
+                in_text = False
+                pos = end + len("</TEXT>")
+                continue
+
+            tag = line.find("<", pos)
+            if tag == -1:
+                break
+            if line.startswith("<DOC>", tag) or line.startswith("</DOC>", tag):
+                # a new document starts (or the current one ends)
+                if docno is not None:
+                    yield docno, sections
+                docno = None
+                sections = []
+                pos = tag + len("<DOC>")
+            elif line.startswith("<DOCNO>", tag):
+                end = line.find("</DOCNO>", tag)
+                if end == -1:
+                    pos = tag + len("<DOCNO>")
+                    continue
+                if docno is None:
+                    docno = line[tag + len("<DOCNO>"):end].strip()
+                pos = end + len("</DOCNO>")
+            elif line.startswith("<TEXT>", tag):
+                in_text = True
+                pos = tag + len("<TEXT>")
+            else:
+                pos = tag + 1
+
+    if docno is not None:
+        yield docno, sections
+
+
+def iter_zip_documents(zip_path, stats=None):
+    """
+    Yields (docno, text) for every document in the files of a zip archive,
+    reading the members directly from the archive without extracting them.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for member in sorted(zip_ref.infolist(), key=lambda info: info.filename):
+            if member.is_dir():
+                continue
+            with zip_ref.open(member) as raw:
+                lines = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+                for docno, text in scan_trec_documents(lines):
+                    if stats is not None:
+                        stats.docs += 1
+                    yield docno, text
+            if stats is not None:
+                stats.bytes += member.file_size
+
+
+def list_corpus_zips(data_dir):
+    """
+    Paths of the zip archives of the corpus, in the order documents get their ids.
+    """
+    return [os.path.join(data_dir, zip_name) for zip_name in sorted(os.listdir(data_dir))
+            if zip_name.endswith(".zip")]
+
+
+def corpus_fingerprint(data_dir):
+    """
+    Hex sha256 of the name, size and modification time of every zip archive of the corpus,
+    so an index saved from the corpus can tell when the corpus has changed since.
+    """
+    digest = hashlib.sha256()
+    for zip_path in list_corpus_zips(data_dir):
+        stat = os.stat(zip_path)
+        digest.update(f"{os.path.basename(zip_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def iter_corpus(data_dir, stats=None):
+    """
+    Yields (docno, text) for every document of every zip archive in `data_dir`.
+    """
+    for zip_path in list_corpus_zips(data_dir):
+        yield from iter_zip_documents(zip_path, stats)
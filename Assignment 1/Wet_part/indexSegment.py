@@ -0,0 +1,228 @@
+from array import array
+import mmap
+import os
+import shutil
+import struct
+from postings import vbyte_encode, vbyte_decode_gaps
+from termDictionary import FrontCodedTermTable, WildcardIndex
+
+# A segment is a directory with three files:
+#   terms.dict    header, source fingerprint, term offsets, postings offsets, document frequencies,
+#                 term blob (sorted terms)
+#   postings.bin  the postings of every term as variable-byte encoded doc id gaps
+#   docnames.bin  header, doc name offsets, doc name blob
+TERMS_FILE = "terms.dict"
+POSTINGS_FILE = "postings.bin"
+DOCNAMES_FILE = "docnames.bin"
+TERMS_MAGIC = b"TRMDICT2"
+DOCNAMES_MAGIC = b"DOCNAME1"
+HEADER = struct.Struct("<8sQ")  # magic, number of entries
+# sha256 digest of the corpus the segment was built from (see corpus_fingerprint), zeros when unknown
+FINGERPRINT = struct.Struct("<32s")
+
+
+def write_string_table(f, magic, strings, extra=b""):
+    """
+    Write `strings` as a header, `extra` header bytes, (count + 1) uint64 offsets and the
+    concatenated utf-8 blob.
+    """
+    offsets = array("Q", [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    f.write(HEADER.pack(magic, len(offsets) - 1))
+    f.write(extra)
+    f.write(offsets.tobytes())
+    return blob
+
+
+def write_segment(index, path, fingerprint=None):
+    """
+    Save an InvertedIndex (term -> sorted doc ids, doc id -> doc name) as a segment directory,
+    with the (hex) fingerprint of the corpus it was built from when given.
+    The files are written to a temporary directory that is then renamed to `path`, so an
+    interrupted write never leaves a partial segment behind.
+    """
+    path = os.path.normpath(path)
+    temp_path = path + ".tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)  # left over by an interrupted write
+    os.makedirs(temp_path)
+    try:
+        write_segment_files(index, temp_path, fingerprint)
+        if os.path.isdir(path):
+            old_path = path + ".old"
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.rename(path, old_path)
+            os.rename(temp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.rename(temp_path, path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+
+def write_segment_files(index, path, fingerprint):
+    """
+    Write the files of a segment into the (existing) directory `path`.
+    """
+    terms = sorted(index.index, key=lambda term: term.encode("utf-8"))
+
+    postings_offsets = array("Q", [0])
+    document_frequencies = array("I")
+    with open(os.path.join(path, POSTINGS_FILE), "wb") as f:
+        offset = 0
+        for term in terms:
+            gaps = []
+            previous = 0
+            for doc_id in index.index[term]:
+                gaps.append(doc_id - previous)
+                previous = doc_id
+            encoded = bytearray()
+            vbyte_encode(gaps, encoded)
+            f.write(encoded)
+            offset += len(encoded)
+            postings_offsets.append(offset)
+            document_frequencies.append(len(gaps))
+
+    with open(os.path.join(path, TERMS_FILE), "wb") as f:
+        source = FINGERPRINT.pack(bytes.fromhex(fingerprint) if fingerprint else b"")
+        blob = write_string_table(f, TERMS_MAGIC, terms, source)
+        f.write(postings_offsets.tobytes())
+        f.write(document_frequencies.tobytes())
+        f.write(blob)
+
+    with open(os.path.join(path, DOCNAMES_FILE), "wb") as f:
+        blob = write_string_table(f, DOCNAMES_MAGIC, (index.doc_ids[doc_id] for doc_id in range(len(index.doc_ids))))
+        f.write(blob)
+
+
+def open_mmap(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_header(buffer, magic, path):
+    found, count = HEADER.unpack_from(buffer, 0)
+    if found != magic:
+        raise ValueError(f"{path} is not a valid index segment file")
+    return count
+
+
+class DocNameTable:
+    """
+    Read-only doc id -> doc name mapping over the memory mapped doc name table.
+    """
+    def __init__(self, path):
+        self.buffer = open_mmap(path)
+        self.count = read_header(self.buffer, DOCNAMES_MAGIC, path)
+        start = HEADER.size
+        self.offsets = memoryview(self.buffer)[start:start + 8 * (self.count + 1)].cast("Q")
+        self.blob_start = start + 8 * (self.count + 1)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, doc_id):
+        if not 0 <= doc_id < self.count:
+            raise KeyError(doc_id)
+        start = self.blob_start + self.offsets[doc_id]
+        end = self.blob_start + self.offsets[doc_id + 1]
+        return self.buffer[start:end].decode("utf-8")
+
+
+class IndexSegment:
+    """
+    Read-only inverted index opened from a segment directory through mmap.
+    Nothing is decoded when the segment is opened, the postings of a term are decoded
+    only when a query asks for them.
+    Offers the same lookups as InvertedIndex, so it can be given to BooleanRetrieval.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.version = 0 # segments never change
+        terms_path = os.path.join(path, TERMS_FILE)
+        self.terms_buffer = open_mmap(terms_path)
+        self.num_terms = read_header(self.terms_buffer, TERMS_MAGIC, terms_path)
+        source, = FINGERPRINT.unpack_from(self.terms_buffer, HEADER.size)
+        self.fingerprint = source.hex() if any(source) else None # of the corpus the segment was built from
+        n = self.num_terms
+        view = memoryview(self.terms_buffer)
+        start = HEADER.size + FINGERPRINT.size
+        self.term_offsets = view[start:start + 8 * (n + 1)].cast("Q")
+        start += 8 * (n + 1)
+        self.postings_offsets = view[start:start + 8 * (n + 1)].cast("Q")
+        start += 8 * (n + 1)
+        self.document_frequencies = view[start:start + 4 * n].cast("I")
+        self.blob_start = start + 4 * n
+
+        self.postings_buffer = open_mmap(os.path.join(path, POSTINGS_FILE))
+        self.doc_ids = DocNameTable(os.path.join(path, DOCNAMES_FILE))
+        self.wildcards = None
+
+    def document_frequency(self, term):
+        term_id = self.find_term(term)
+        return self.document_frequencies[term_id] if term_id != -1 else 0
+
+    def term(self, term_id):
+        start = self.blob_start + self.term_offsets[term_id]
+        end = self.blob_start + self.term_offsets[term_id + 1]
+        return self.terms_buffer[start:end]
+
+    def find_term(self, term):
+        """
+        Binary search of the sorted term dictionary, returns the term id or -1.
+        """
+        key = term.encode("utf-8")
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self.term(lo) == key:
+            return lo
+        return -1
+
+    def get_postings(self, term):
+        term_id = self.find_term(term)
+        if term_id == -1:
+            return []
+        return self.postings_by_id(term_id)
+
+    def postings_by_id(self, term_id):
+        doc_ids, _ = vbyte_decode_gaps(self.postings_buffer, self.postings_offsets[term_id],
+                                       self.document_frequencies[term_id], 0)
+        return doc_ids
+
+    def iter_terms(self):
+        """
+        Yields (term, postings) for every term, in sorted term order.
+        """
+        for term_id in range(self.num_terms):
+            yield self.term(term_id).decode("utf-8"), self.postings_by_id(term_id)
+
+    def wildcard_index(self):
+        """
+        The WildcardIndex over the term dictionary, built on the first wildcard query.
+        """
+        if self.wildcards is None:
+            terms = [self.term(term_id).decode("utf-8") for term_id in range(self.num_terms)]
+            self.wildcards = WildcardIndex(FrontCodedTermTable(terms))
+        return self.wildcards
+
+    def expand_terms(self, pattern):
+        return [term for term, _ in self.wildcard_index().expand(pattern)]
+
+    def expand_postings(self, pattern):
+        return [self.postings_by_id(term_id) for _, term_id in self.wildcard_index().expand(pattern)]
+
+    def convert_from_doc_id_to_name(self, doc_id_list):
+        results = []
+        for doc_id in doc_id_list:
+            results.append(self.doc_ids[doc_id])
+        return results
@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left, insort
+import heapq
+
+
+class IndexStatistics:
+    """
+    Collection statistics of an InvertedIndex.
+
+    The document frequency of a term is the length of its postings list. Terms are grouped
+    in buckets by document frequency and the distinct frequencies are kept sorted, so the
+    top / bottom terms, the df histogram and the other statistics are read from the buckets
+    instead of scanning the whole vocabulary. Adding a document only records its term ids
+    (one set update per document); the buckets are brought up to date on the next query by
+    moving the terms whose postings grew since then. Terms with the same document frequency
+    are ordered by the term itself, so the order does not depend on how term ids were
+    assigned (the serial and the parallel build intern the terms in different orders).
+    """
+    def __init__(self, postings, terms):
+        self.postings = postings # term id -> postings list, the list of the index
+        self.terms = terms # TermDictionary of the index
+        self.num_docs = 0
+        self.total_postings = 0
+        self.bucket_df = array("I") # term id -> document frequency of the term's bucket
+        self.buckets = {} # document frequency -> set of term ids
+        self.frequencies = [] # sorted distinct document frequencies
+        self.changed = set() # term ids whose postings grew since the buckets were updated
+        self.cache = {} # (n, most frequent first) -> term ids, cleared when the buckets change
+
+    def add_document(self, term_ids):
+        """
+        Count a new document with the given distinct term ids.
+        """
+        self.num_docs += 1
+        self.total_postings += len(term_ids)
+        self.changed.update(term_ids)
+
+    def add_postings(self, term_id, count):
+        """
+        Count `count` postings added to the postings of a term.
+        """
+        self.total_postings += count
+        self.changed.add(term_id)
+
+    def update_buckets(self):
+        """
+        Move the terms whose postings grew to the bucket of their new document frequency.
+        """
+        if not self.changed:
+            return
+        bucket_df = self.bucket_df
+        if len(bucket_df) < len(self.postings):
+            bucket_df.extend(bytes(4 * (len(self.postings) - len(bucket_df))))
+        buckets = self.buckets
+        for term_id in self.changed:
+            old = bucket_df[term_id]
+            new = len(self.postings[term_id])
+            if old == new:
+                continue
+            if old:
+                bucket = buckets[old]
+                bucket.discard(term_id)
+                if not bucket:
+                    del buckets[old]
+                    del self.frequencies[bisect_left(self.frequencies, old)]
+            if new not in buckets:
+                buckets[new] = set()
+                insort(self.frequencies, new)
+            buckets[new].add(term_id)
+            bucket_df[term_id] = new
+        self.changed.clear()
+        self.cache.clear()
+
+    def df(self, term_id):
+        return len(self.postings[term_id])
+
+    def select(self, n, largest):
+        """
+        The n term ids with the highest (or lowest) document frequency, ties broken by term.
+        Whole buckets are taken from the end of the frequencies, the last one only for the
+        places left.
+        """
+        self.update_buckets()
+        key = (n, largest)
+        if key in self.cache:
+            return self.cache[key]
+        term_key = self.terms.sort_key()
+        selected = []
+        for frequency in (reversed(self.frequencies) if largest else self.frequencies):
+            if len(selected) >= n:
+                break
+            bucket = self.buckets[frequency]
+            if len(bucket) <= n - len(selected):
+                selected.extend(sorted(bucket, key=term_key))
+            else:
+                selected.extend(heapq.nsmallest(n - len(selected), bucket, key=term_key))
+        self.cache[key] = selected
+        return selected
+
+    def top(self, n):
+        """
+        The n terms with the highest document frequency, most frequent first.
+        """
+        return self.select(n, True)
+
+    def bottom(self, n):
+        """
+        The n terms with the lowest document frequency, least frequent first.
+        """
+        return self.select(n, False)
+
+    def df_histogram(self):
+        """
+        Document frequency -> number of terms with that frequency.
+        """
+        self.update_buckets()
+        return {frequency: len(self.buckets[frequency]) for frequency in self.frequencies}
+
+    def stats(self):
+        self.update_buckets()
+        vocabulary_size = len(self.postings)
+        return {
+            "documents": self.num_docs,
+            "vocabulary_size": vocabulary_size,
+            "total_postings": self.total_postings,
+            "postings_per_document": self.total_postings / self.num_docs if self.num_docs else 0.0,
+            "postings_per_term": self.total_postings / vocabulary_size if vocabulary_size else 0.0,
+            "max_df": self.frequencies[-1] if self.frequencies else 0,
+            "distinct_df_values": len(self.frequencies),
+        }
+
+    def format_metrics(self, stats=None, prefix="inverted_index"):
+        """
+        The statistics (or the given `stats` dictionary) in the Prometheus text
+        exposition format, for monitoring.
+        """
+        lines = []
+        for name, value in (stats or self.stats()).items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        # terms grouped by power of two document frequency ranges: [1], [2, 3], [4, 7], ...
+        ranges = {}
+        for frequency, count in self.df_histogram().items():
+            low = 1 << (frequency.bit_length() - 1)
+            ranges[low] = ranges.get(low, 0) + count
+        lines.append(f"# TYPE {prefix}_terms_by_df gauge")
+        for low, count in ranges.items():
+            lines.append(f'{prefix}_terms_by_df{{df_from="{low}",df_to="{2 * low - 1}"}} {count}')
+        return "\n".join(lines) + "\n"
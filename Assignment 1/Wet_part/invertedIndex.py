@@ -1,18 +1,39 @@
-from collections import defaultdict
-import re
-import heapq
+from array import array
+from collections import Counter
 import os
-import zipfile
-from tempfile import TemporaryDirectory
+from corpusReader import IngestStats
+from indexStatistics import IndexStatistics
+from termDictionary import TermDictionary, TermPostingsView
+from indexSegment import write_segment
+from parallelIndexer import build_index
+from postings import CompressedPostings, BitmapPostings, PositionalPostings, FrequencyPostings, memory_report, is_dense, BLOCK_SIZE
+
+POSTINGS_BACKENDS = {"list": list, "compressed": CompressedPostings}
 
 class InvertedIndex:
-	def __init__(self):
+	def __init__(self, backend="list", positions=False, frequencies=False):
 		"""
 		Initialize the data structure of the inverted index,
 		implemented as learned at class and described at HW.
+		backend is "list" (postings as Python lists) or "compressed"
+		(postings as variable-byte encoded gaps, see postings.py).
+		With positions=True the word positions of every term in every document
+		are stored as well (compressed, see PositionalPostings), for PHRASE and NEAR/k queries.
+		With frequencies=True the number of occurrences of every term in every document
+		and the length of every document are stored, for ranked retrieval (see rankedRetrieval.py).
 		"""
-		self.index = defaultdict(list) # InvertedIndex data sreucture
+		if backend not in POSTINGS_BACKENDS:
+			raise ValueError(f"Unknown postings backend '{backend}'")
+		self.backend = backend
+		self.terms = TermDictionary() # term <-> term id
+		self.postings = [] # term id -> postings list
+		self.positions = [] if positions else None # term id -> PositionalPostings
+		self.frequencies = [] if frequencies else None # term id -> FrequencyPostings
+		self.doc_lengths = array("I") if frequencies else None # doc id -> number of words
+		self.index = TermPostingsView(self.terms, self.postings) # InvertedIndex data sreucture, term -> postings list
 		self.doc_ids = {} # Doc Id (key) to Doc name (value) dictionary
+		self.version = 0 # incremented on every change, lets caches notice stale entries
+		self.statistics = IndexStatistics(self.postings, self.terms) # collection statistics, document frequencies are the postings lengths
 
 	def add_document(self, text, docno):
 		"""
@@ -21,14 +42,161 @@ class InvertedIndex:
 		# add mapping of Document name to Document ID
 		doc_id = len(self.doc_ids)
 		self.doc_ids[doc_id] = docno[0]
+		self.version += 1
 
-		sob = set()
-		# create set of words and add it to data sreucture.
+		# count the words of every section in C, then intern every distinct word and add
+		# the document to its postings once, with one statistics update for the document
+		counts = Counter()
 		for t_section in text:
-			words = t_section.strip()
-			sob = sob.union(set(words.split()))
-		for word in sob:
-			self.index[word].append(doc_id)
+			counts.update(t_section.split())
+		ids = self.terms.mutable_ids()
+		postings = self.postings
+		term_ids = []
+		for word in counts:
+			term_id = ids.get(word)
+			if term_id is None:
+				term_id = self.add_term(word)
+			postings[term_id].append(doc_id)
+			term_ids.append(term_id)
+		self.statistics.add_document(term_ids)
+		if self.positions is not None:
+			self.add_positions(doc_id, text)
+		if self.frequencies is not None:
+			self.add_frequencies(doc_id, counts)
+
+	def add_positions(self, doc_id, text):
+		"""
+		Record the position (word offset over all the text sections) of every word of a document.
+		"""
+		ids = self.terms.mutable_ids()
+		doc_positions = {} # term id -> positions in this document
+		words = (word for t_section in text for word in t_section.split())
+		for position, word in enumerate(words):
+			term_id = ids[word]
+			if term_id in doc_positions:
+				doc_positions[term_id].append(position)
+			else:
+				doc_positions[term_id] = [position]
+		for term_id, positions in doc_positions.items():
+			self.positions[term_id].append(doc_id, positions)
+
+	def add_frequencies(self, doc_id, counts):
+		"""
+		Record the number of occurrences of every word of a document (word -> count), and its length.
+		"""
+		ids = self.terms.mutable_ids()
+		for word, count in counts.items():
+			self.frequencies[ids[word]].append(doc_id, count)
+		self.doc_lengths.append(sum(counts.values()))
+
+	def add_term(self, term):
+		"""
+		Intern a new term and give it an empty postings list. Returns its term id.
+		"""
+		term_id = self.terms.intern(term)
+		if term_id == len(self.postings):
+			self.postings.append(POSTINGS_BACKENDS[self.backend]())
+			if self.positions is not None:
+				self.positions.append(PositionalPostings())
+			if self.frequencies is not None:
+				self.frequencies.append(FrequencyPostings())
+		return term_id
+
+	def add_postings(self, term, doc_ids, base=0, positions=None, frequencies=None):
+		"""
+		Append sorted doc ids (shifted by `base`), all greater than the term's current postings,
+		to the postings of a term, with their PositionalPostings and FrequencyPostings if the
+		index keeps them.
+		Used when merging partial indexes.
+		"""
+		term_id = self.terms.get_id(term)
+		if term_id == -1:
+			term_id = self.add_term(term)
+		self.postings[term_id].extend([doc_id + base for doc_id in doc_ids] if base else doc_ids)
+		if self.positions is not None and positions is not None:
+			self.positions[term_id].extend(positions, base)
+		if self.frequencies is not None and frequencies is not None:
+			self.frequencies[term_id].extend(frequencies, base)
+		self.statistics.add_postings(term_id, len(doc_ids))
+		self.version += 1
+
+	def get_postings(self, term):
+		"""
+		Returns the postings list of a term (empty for unknown terms, without adding them to the index).
+		"""
+		term_id = self.terms.get_id(term)
+		return self.postings[term_id] if term_id != -1 else []
+
+	def get_positions(self, term):
+		"""
+		Returns the PositionalPostings of a term, or None when the index does not keep positions.
+		"""
+		if self.positions is None:
+			return None
+		term_id = self.terms.get_id(term)
+		return self.positions[term_id] if term_id != -1 else PositionalPostings()
+
+	def expand_terms(self, pattern):
+		"""
+		Returns the terms matching a wildcard term ("term*", "*term" or "te*rm"), in sorted order.
+		"""
+		return [term for term, _ in self.terms.expand(pattern)]
+
+	def expand_postings(self, pattern):
+		"""
+		Returns the postings lists of the terms matching a wildcard term, found by term id.
+		"""
+		return [self.postings[term_id] for _, term_id in self.terms.expand(pattern)]
+
+	def get_frequencies(self, term):
+		"""
+		Returns the FrequencyPostings of a term, or None when the index does not keep frequencies.
+		"""
+		if self.frequencies is None:
+			return None
+		term_id = self.terms.get_id(term)
+		return self.frequencies[term_id] if term_id != -1 else FrequencyPostings()
+
+	def optimize(self):
+		"""
+		Pick the postings container of every term by its density:
+		terms dense enough that a bitmap is no larger than the backend's encoding
+		of their postings are stored as bitmaps (see is_dense),
+		terms with less than a block of postings as plain sorted arrays,
+		the others keep the backend's sorted postings.
+		The term dictionary is frozen into its compact front coded form.
+		"""
+		num_docs = len(self.doc_ids)
+		for term_id, postings in enumerate(self.postings):
+			if is_dense(postings, num_docs, compressed=self.backend == "compressed"):
+				if not isinstance(postings, BitmapPostings):
+					self.postings[term_id] = BitmapPostings(postings)
+			elif len(postings) < BLOCK_SIZE:
+				if not isinstance(postings, array):
+					self.postings[term_id] = array("I", postings)
+			elif not isinstance(postings, POSTINGS_BACKENDS[self.backend]):
+				self.postings[term_id] = POSTINGS_BACKENDS[self.backend](postings)
+		self.terms.freeze()
+
+	def document_frequency(self, term):
+		term_id = self.terms.get_id(term)
+		return len(self.postings[term_id]) if term_id != -1 else 0
+
+	def get_stats(self):
+		"""
+		Collection statistics: vocabulary size, total postings, bytes per term, etc.
+		"""
+		stats = self.statistics.stats()
+		stats["term_bytes"] = self.terms.nbytes()
+		stats["bytes_per_term"] = stats["term_bytes"] / len(self.terms) if len(self.terms) else 0.0
+		return stats
+
+	def save(self, path, fingerprint=None):
+		"""
+		Save the index as an on-disk segment that IndexSegment can open (see indexSegment.py),
+		recording the fingerprint of the corpus it was built from when given.
+		"""
+		write_segment(self, path, fingerprint)
 
 	def print(self):
 		"""
@@ -38,27 +206,51 @@ class InvertedIndex:
 			postings = "-> ".join(f'{idx + 1} ({self.doc_ids[idx]})' for idx in docs)
 			print(f'{word} -> {postings}')
 
+	def get_memory_report(self):
+		"""
+		Report the memory held by the postings compared with the list backend.
+		"""
+		report = memory_report(self.index, len(self.doc_ids))
+		result_string = f"Postings backend: {self.backend}\n"
+		result_string += f"Terms: {report['terms']}, Postings: {report['postings']}\n"
+		result_string += f"List backend: {report['list_bytes'] / 2**20:.1f} MB ({report['list_bytes_per_posting']:.2f} bytes/posting)\n"
+		result_string += f"{self.backend} backend: {report['postings_bytes'] / 2**20:.1f} MB ({report['postings_bytes_per_posting']:.2f} bytes/posting)\n"
+		result_string += f"Term dictionary: {self.terms.nbytes() / 2**20:.1f} MB\n"
+		if self.positions is not None:
+			positions_bytes = sum(positions.nbytes() for positions in self.positions)
+			result_string += f"Positions: {positions_bytes / 2**20:.1f} MB\n"
+		if self.frequencies is not None:
+			frequencies_bytes = sum(frequencies.nbytes() for frequencies in self.frequencies) + self.doc_lengths.itemsize * len(self.doc_lengths)
+			result_string += f"Term frequencies: {frequencies_bytes / 2**20:.1f} MB\n"
+		return result_string
+
+	def convert_from_doc_id_to_name(self, doc_id_list):
+		results = []
+		for doc_id in doc_id_list:
+			results.append(self.doc_ids[doc_id])
+		return results
+
 	def get_top_occurrences(self, n):
-		# use heapq to retrieve the nsmallest as it more efficient than sorting
-		top_occurrences_tokens = heapq.nlargest(n, self.index.keys(), key=lambda k: len(self.index[k]))
+		# the statistics select (and cache) the n terms with the highest document frequency
+		top_occurrences_tokens = [self.terms.term(term_id) for term_id in self.statistics.top(n)]
 		result_string = "The Top 10 Frequent Tokes are:\n"
 		for token in top_occurrences_tokens:
-			result_string += f"Token: '{token}', Number of Occurrences: {len(self.index[token])}\n"
+			result_string += f"Token: '{token}', Number of Occurrences: {self.document_frequency(token)}\n"
 		return result_string
 
 	def get_bottom_occurrences(self, n):
-		# use heapq to retrieve the nsmallest as it more efficient than sorting
-		bottom_occurrences_tokens = heapq.nsmallest(n, self.index.keys(), key=lambda k: len(self.index[k]))
+		# the statistics select (and cache) the n terms with the lowest document frequency
+		bottom_occurrences_tokens = [self.terms.term(term_id) for term_id in self.statistics.bottom(n)]
 		result_string = "The Bottom 10 Frequent Tokes are:\n"
 		for token in bottom_occurrences_tokens:
-			result_string += f"Token: '{token}', Number of Occurrences: {len(self.index[token])}\n"
+			result_string += f"Token: '{token}', Number of Occurrences: {self.document_frequency(token)}\n"
 		return result_string
 
 def main():
 
     # Part 1
 
-	index = InvertedIndex()
+	index = InvertedIndex(backend="compressed")
 
 	curr_dir = os.path.dirname(os.path.abspath(__file__))
 	data_dir = os.path.join(curr_dir, "data")
@@ -67,26 +259,16 @@ def main():
 		print("No 'data' folder found")
 		return
 
-	for zip_name in os.listdir(data_dir):
-		zip_path = os.path.join(data_dir, zip_name)
-
-		with TemporaryDirectory() as temp_dir:
-			with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-				zip_ref.extractall(temp_dir)
-
-			for root, _, files in os.walk(temp_dir):
-				for file in files:
-					file_path = os.path.join(root, file)
-					with open(file_path, 'r') as file:
-						fdocs = file.read()
-						docs = fdocs.split(r"<DOC>")
-						for doc in docs[1:]:
-							docno = re.findall(r"<DOCNO> (.*?) </DOCNO>", doc)
-							text = re.findall(r"<TEXT>(.*?)</TEXT>", doc, re.DOTALL)
-							index.add_document(text,docno)
+	# stream the documents straight out of the zip files, one worker process per zip
+	stats = IngestStats()
+	build_index(index, data_dir, workers=os.cpu_count() or 1, stats=stats)
+	print(stats.report())
+	index.optimize()
 
     # Part 3
 
+	print(index.get_memory_report())
+
 	results = index.get_top_occurrences(10)
 	results += "\n"
 	results += index.get_bottom_occurrences(10)
@@ -0,0 +1,86 @@
+from array import array
+try:
+    import numpy as np
+except ImportError: # the pure Python backend does not need numpy
+    np = None
+from postings import BitmapPostings
+
+
+def as_array(postings):
+    """
+    The postings as a sorted uint32 NumPy array.
+    """
+    if isinstance(postings, np.ndarray):
+        return postings
+    if isinstance(postings, BitmapPostings):
+        bits = np.frombuffer(postings.to_bytes(), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(bits, bitorder="little")).astype(np.uint32)
+    if isinstance(postings, (list, array)):
+        return np.array(postings, dtype=np.uint32)
+    return np.fromiter(postings, dtype=np.uint32, count=len(postings))
+
+
+def contains_sorted(sorted_array, values):
+    """
+    Boolean mask telling which of `values` are in `sorted_array`, with one vectorized binary search.
+    """
+    if len(sorted_array) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_array, values)
+    positions[positions == len(sorted_array)] = 0
+    return sorted_array[positions] == values
+
+
+class NumpySetOperations:
+    """
+    AND / OR / NOT / AND-NOT on sorted uint32 arrays with vectorized NumPy primitives.
+    Term postings are converted to arrays once and kept, per index version.
+    """
+    def __init__(self):
+        if np is None:
+            raise ImportError("The numpy backend requires numpy")
+        self.arrays = {}
+        self.version = None
+
+    def postings(self, index, term):
+        if index.version != self.version:
+            self.arrays = {}
+            self.version = index.version
+        array = self.arrays.get(term)
+        if array is None:
+            array = as_array(index.get_postings(term))
+            self.arrays[term] = array
+        return array
+
+    def intersection_many(self, postings_lists):
+        postings_lists = sorted((as_array(postings) for postings in postings_lists), key=len)
+        result = postings_lists[0]
+        for postings in postings_lists[1:]:
+            # binary search every candidate of the (shorter) result in the next list
+            result = result[contains_sorted(postings, result)]
+        return result
+
+    def union(self, listA, listB):
+        listA, listB = as_array(listA), as_array(listB)
+        if len(listA) > len(listB):
+            listA, listB = listB, listA
+        # insert the doc ids of the shorter list that are missing from the longer one at their sorted positions
+        missing = listA[~contains_sorted(listB, listA)]
+        return np.insert(listB, np.searchsorted(listB, missing), missing)
+
+    def union_many(self, postings_lists):
+        if not postings_lists:
+            return np.zeros(0, dtype=np.uint32)
+        return np.unique(np.concatenate([as_array(postings) for postings in postings_lists]))
+
+    def difference(self, listA, listB):
+        listA = as_array(listA)
+        return listA[~contains_sorted(as_array(listB), listA)]
+
+    def not_operator(self, num, exclude_list):
+        mask = np.ones(num, dtype=bool)
+        mask[as_array(exclude_list)] = False
+        return np.flatnonzero(mask).astype(np.uint32)
+
+    def to_list(self, result):
+        return as_array(result).tolist()
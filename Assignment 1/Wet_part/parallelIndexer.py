@@ -0,0 +1,78 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import heapq
+from corpusReader import IngestStats, iter_corpus, iter_zip_documents, list_corpus_zips
+
+
+def build_partial_index(index_class, options, zip_path):
+    """
+    Worker: index the documents of one zip file in memory (SPIMI style) with local doc ids
+    starting from 0, using the same add_document as the serial build.
+    options are the positions / frequencies flags of the index being built.
+
+    Returns (docnos, doc lengths or None, postings, bytes read) where postings is a list of
+    (term, array of local doc ids, PositionalPostings or None, FrequencyPostings or None)
+    sorted by term.
+    """
+    partial_index = index_class(backend="list", **options)
+    stats = IngestStats()
+    docnos = []
+    for docno, text in iter_zip_documents(zip_path, stats):
+        partial_index.add_document(text, [docno])
+        docnos.append(docno)
+    postings = [(term, array("I", doc_ids), partial_index.get_positions(term), partial_index.get_frequencies(term))
+                for term, doc_ids in sorted(partial_index.index.items(), key=lambda item: item[0])]
+    return docnos, partial_index.doc_lengths, postings, stats.bytes
+
+
+def tag_partial_postings(part, postings):
+    for term, doc_ids, positions, frequencies in postings:
+        yield term, part, doc_ids, positions, frequencies
+
+
+def merge_partial_indexes(index, partial_indexes):
+    """
+    k-way merge of sorted partial indexes into `index`. The local doc ids of every partial index
+    are shifted by the number of documents in the partial indexes before it, so the postings of a
+    term are concatenated in increasing doc id order.
+    """
+    bases = []
+    for docnos, doc_lengths, _, _ in partial_indexes:
+        bases.append(len(index.doc_ids))
+        for docno in docnos:
+            index.doc_ids[len(index.doc_ids)] = docno
+        index.statistics.num_docs += len(docnos)
+        if index.doc_lengths is not None:
+            index.doc_lengths.extend(doc_lengths)
+
+    streams = [tag_partial_postings(part, part_postings)
+               for part, (_, _, part_postings, _) in enumerate(partial_indexes)]
+    for term, part, postings, positions, frequencies in heapq.merge(*streams, key=lambda entry: (entry[0], entry[1])):
+        index.add_postings(term, postings, bases[part], positions, frequencies)
+    index.version += 1
+    return index
+
+
+def build_index(index, data_dir, workers=1, stats=None):
+    """
+    Add every document of the zip files in `data_dir` to `index`.
+    With more than one worker, every zip file is indexed by its own process and the
+    partial indexes are merged; the result is identical to the serial build.
+    """
+    if workers <= 1:
+        for docno, text in iter_corpus(data_dir, stats):
+            index.add_document(text, [docno])
+        return index
+
+    zip_paths = list_corpus_zips(data_dir)
+    options = {"positions": index.positions is not None, "frequencies": index.frequencies is not None}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partial_indexes = list(executor.map(partial(build_partial_index, type(index), options), zip_paths))
+    merge_partial_indexes(index, partial_indexes)
+
+    if stats is not None:
+        for docnos, _, _, bytes_read in partial_indexes:
+            stats.docs += len(docnos)
+            stats.bytes += bytes_read
+    return index
@@ -0,0 +1,737 @@
+from array import array
+from bisect import bisect_left
+import heapq
+import sys
+
+BLOCK_SIZE = 128
+# use galloping search once the longer list is this many times longer than the shorter one
+GALLOP_RATIO = 8
+# bit positions set in every byte value, used to decode bitmaps a byte at a time
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+# variable-byte encoding of the gaps that fit in a single byte
+GAP_BYTES = [bytes((gap | 128,)) for gap in range(128)]
+
+
+def vbyte_encode(numbers, out):
+    """
+    Append the variable-byte encoding of every number in `numbers` to `out`.
+    Each number is written in 7-bit groups, the last byte of a number has its high bit set.
+    """
+    for n in numbers:
+        while n >= 128:
+            out.append(n & 127)
+            n >>= 7
+        out.append(n | 128)
+
+
+def vbyte_decode_gaps(data, start, count, base):
+    """
+    Decode `count` delta gaps from `data` starting at byte `start`.
+    Returns the absolute values (prefix sums starting from `base`) and the end offset.
+    """
+    results = []
+    pos = start
+    value = base
+    for _ in range(count):
+        n = 0
+        shift = 0
+        byte = data[pos]
+        while byte < 128:
+            n |= byte << shift
+            shift += 7
+            pos += 1
+            byte = data[pos]
+        n |= (byte & 127) << shift
+        pos += 1
+        value += n
+        results.append(value)
+    return results, pos
+
+
+class CompressedPostings:
+    """
+    Postings list of increasing doc ids stored as variable-byte encoded delta gaps.
+
+    The gaps of all the postings live in a single buffer, split into blocks of BLOCK_SIZE
+    doc ids. A list shorter than a block is only that buffer, an immutable bytes object of
+    its exact size, so the many short lists of a vocabulary cost one small object each.
+    Once a block is complete the buffer becomes a growable bytearray, and the last doc id
+    and end offset of every full block are kept in two arrays so a single block can be
+    decoded (or skipped) without touching the others.
+    """
+    __slots__ = ("_data", "_skips", "_last", "_size")
+
+    def __init__(self, doc_ids=()):
+        self._data = b""
+        self._skips = None # (last doc ids, end offsets) of the full blocks, once there is one
+        self._last = 0
+        self._size = 0
+        self.extend(doc_ids)
+
+    def append(self, doc_id):
+        if self._size and doc_id <= self._last:
+            raise ValueError(f"doc ids must be added in increasing order ({doc_id} after {self._last})")
+        gap = doc_id - self._last
+        if gap < 128:
+            self._data += GAP_BYTES[gap]
+        else:
+            encoded = bytearray()
+            vbyte_encode((gap,), encoded)
+            self._data += encoded
+        self._last = doc_id
+        self._size += 1
+        if not self._size % BLOCK_SIZE:
+            if self._skips is None:
+                self._data = bytearray(self._data)
+                self._skips = (array("I"), array("I"))
+            self._skips[0].append(doc_id)
+            self._skips[1].append(len(self._data))
+
+    def extend(self, doc_ids):
+        for doc_id in doc_ids:
+            self.append(doc_id)
+
+    def last(self):
+        if not self._size:
+            raise IndexError("last() of empty postings")
+        return self._last
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # the gaps continue from block to block, the whole list decodes in one pass
+        return iter(vbyte_decode_gaps(self._data, 0, self._size, 0)[0])
+
+    def __eq__(self, other):
+        if isinstance(other, CompressedPostings):
+            return self._size == other._size and self._data == other._data
+        return NotImplemented
+
+    def __repr__(self):
+        return f"CompressedPostings({self.to_list()})"
+
+    def to_list(self):
+        return vbyte_decode_gaps(self._data, 0, self._size, 0)[0]
+
+    def full_blocks(self):
+        return len(self._skips[0]) if self._skips is not None else 0
+
+    def block_count(self):
+        """
+        Number of blocks, counting the last partial block.
+        """
+        return -(-self._size // BLOCK_SIZE)
+
+    def block_bounds(self, i):
+        """
+        Returns (lower, upper) such that every doc id in block `i` is in [lower, upper].
+        """
+        lower = self._skips[0][i - 1] + 1 if i > 0 else 0
+        if i < self.full_blocks():
+            return lower, self._skips[0][i]
+        return lower, self._last
+
+    def decode_block(self, i):
+        """
+        Decode block `i` into a list of doc ids.
+        """
+        if i > 0:
+            base, start = self._skips[0][i - 1], self._skips[1][i - 1]
+        else:
+            base, start = 0, 0
+        count = min(BLOCK_SIZE, self._size - i * BLOCK_SIZE)
+        doc_ids, _ = vbyte_decode_gaps(self._data, start, count, base)
+        return doc_ids
+
+    def find_block(self, target, start=0):
+        """
+        Index of the first block (from `start`) that may contain a doc id >= `target`,
+        found by binary search over the block last doc ids (the skip pointers).
+        Returns block_count() when no such block exists.
+        """
+        full = self.full_blocks()
+        i = bisect_left(self._skips[0], target, start) if full else start
+        if i >= full and not (self._size > full * BLOCK_SIZE and self._last >= target):
+            return self.block_count()
+        return i
+
+    def encoded_bytes(self):
+        """
+        Size of the encoded postings: the gaps and 8 bytes of skip pointers per full block.
+        """
+        return len(self._data) + 8 * self.full_blocks()
+
+    def nbytes(self):
+        """
+        Approximate number of bytes held by this postings list.
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self._data)
+        if self._skips is not None:
+            size += sys.getsizeof(self._skips) + sys.getsizeof(self._skips[0]) + sys.getsizeof(self._skips[1])
+        return size
+
+
+class BitmapPostings:
+    """
+    Postings list of a dense term stored as a bitset, one bit per document.
+    Set operations with other postings run as bitwise operations on whole
+    machine words (through Python big ints, see bitmap_of).
+    """
+    __slots__ = ("_bits", "_size")
+
+    def __init__(self, doc_ids=()):
+        self._bits = bytearray()
+        self._size = 0
+        self.extend(doc_ids)
+
+    def append(self, doc_id):
+        byte = doc_id >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        mask = 1 << (doc_id & 7)
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self._size += 1
+
+    def extend(self, doc_ids):
+        for doc_id in doc_ids:
+            self.append(doc_id)
+
+    def __contains__(self, doc_id):
+        byte = doc_id >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] >> (doc_id & 7) & 1)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(decode_bits(self._bits))
+
+    def __eq__(self, other):
+        if isinstance(other, BitmapPostings):
+            return self.to_int() == other.to_int()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"BitmapPostings({self.to_list()})"
+
+    def to_list(self):
+        return decode_bits(self._bits)
+
+    def to_int(self):
+        return int.from_bytes(self._bits, "little")
+
+    def to_bytes(self):
+        return bytes(self._bits)
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self._bits)
+
+
+class PositionalPostings:
+    """
+    Word positions of a term in every document of its postings.
+    The doc ids are kept in an array (searched with bisect); the positions in each
+    document are stored as their count followed by variable-byte encoded delta gaps,
+    in one contiguous bytearray with the start offset of every document in an array.
+    """
+    __slots__ = ("doc_ids", "offsets", "data")
+
+    def __init__(self):
+        self.doc_ids = array("I")
+        self.offsets = array("I")
+        self.data = bytearray()
+
+    def append(self, doc_id, positions):
+        """
+        Add the (increasing) positions of the term in a document after the last one.
+        """
+        self.doc_ids.append(doc_id)
+        self.offsets.append(len(self.data))
+        vbyte_encode([len(positions)], self.data)
+        vbyte_encode([position - previous for previous, position in zip([0] + positions, positions)], self.data)
+
+    def extend(self, other, base=0):
+        """
+        Append the documents of another PositionalPostings, shifting its doc ids by `base`.
+        """
+        start = len(self.data)
+        self.doc_ids.extend(doc_id + base for doc_id in other.doc_ids)
+        self.offsets.extend(offset + start for offset in other.offsets)
+        self.data += other.data
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def positions_at(self, i):
+        """
+        The positions of the term in the i-th document of the postings.
+        """
+        count, pos = vbyte_decode_gaps(self.data, self.offsets[i], 1, 0)
+        return vbyte_decode_gaps(self.data, pos, count[0], 0)[0]
+
+    def positions_of(self, doc_ids):
+        """
+        Yields the positions of the term in each of the (increasing) `doc_ids`,
+        every lookup searching only the postings after the previous one.
+        An empty list is yielded for documents that do not contain the term.
+        """
+        lo = 0
+        for doc_id in doc_ids:
+            lo = bisect_left(self.doc_ids, doc_id, lo)
+            if lo < len(self.doc_ids) and self.doc_ids[lo] == doc_id:
+                yield self.positions_at(lo)
+            else:
+                yield []
+
+    def nbytes(self):
+        return sys.getsizeof(self.doc_ids) + sys.getsizeof(self.offsets) + sys.getsizeof(self.data)
+
+
+class FrequencyPostings:
+    """
+    Term frequencies of a term: its doc ids and the number of times it occurs in each
+    of them, in two parallel arrays. Used by ranked retrieval.
+    """
+    __slots__ = ("doc_ids", "frequencies")
+
+    def __init__(self):
+        self.doc_ids = array("I")
+        self.frequencies = array("I")
+
+    def append(self, doc_id, frequency):
+        self.doc_ids.append(doc_id)
+        self.frequencies.append(frequency)
+
+    def extend(self, other, base=0):
+        """
+        Append the documents of another FrequencyPostings, shifting its doc ids by `base`.
+        """
+        self.doc_ids.extend(doc_id + base for doc_id in other.doc_ids)
+        self.frequencies.extend(other.frequencies)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def nbytes(self):
+        return sys.getsizeof(self.doc_ids) + sys.getsizeof(self.frequencies)
+
+
+def phrase_match(positions_lists):
+    """
+    True when the terms occur one right after the other: some position p of the first
+    term with p + i among the positions of the i-th term, for every term.
+    """
+    starts = set(positions_lists[0])
+    for i, positions in enumerate(positions_lists[1:], 1):
+        starts.intersection_update(position - i for position in positions)
+        if not starts:
+            return False
+    return bool(starts)
+
+
+def near_match(positionsA, positionsB, distance):
+    """
+    True when some position of A and some position of B are at most `distance` apart
+    (in either order). A merge walk over the two sorted lists advancing the smaller one.
+    """
+    i, j = 0, 0
+    while i < len(positionsA) and j < len(positionsB):
+        if abs(positionsA[i] - positionsB[j]) <= distance:
+            return True
+        if positionsA[i] < positionsB[j]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def decode_bits(bits):
+    """
+    Sorted list of the positions of the set bits of a bitset (int, or little endian bytes).
+    """
+    if isinstance(bits, int):
+        bits = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    results = []
+    for byte_index, byte in enumerate(bits):
+        if byte:
+            base = byte_index << 3
+            results.extend(base + bit for bit in BYTE_BITS[byte])
+    return results
+
+
+def bitmap_of(postings):
+    """
+    The postings as a bitset int (bit i is set when doc id i is in the postings).
+    """
+    if isinstance(postings, BitmapPostings):
+        return postings.to_int()
+    bits = bytearray()
+    for doc_id in postings:
+        byte = doc_id >> 3
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        bits[byte] |= 1 << (doc_id & 7)
+    return int.from_bytes(bits, "little")
+
+
+def is_bitmap(postings):
+    return isinstance(postings, BitmapPostings)
+
+
+def vbyte_size(doc_ids):
+    """
+    Number of bytes of the variable-byte encoded delta gaps of increasing doc ids.
+    """
+    size = 0
+    previous = 0
+    for doc_id in doc_ids:
+        size += (doc_id - previous).bit_length() // 7 + 1
+        previous = doc_id
+    return size
+
+
+def is_dense(postings, num_docs, compressed=False):
+    """
+    True when a bitmap of `num_docs` bits is no larger than the postings as the backend
+    stores them: 4 bytes per doc id for sorted lists and arrays (a density of 1/32 and up),
+    the encoded gaps for compressed postings (much denser terms, since the gaps of a
+    frequent term mostly take a single byte).
+    """
+    if num_docs <= 0 or not len(postings):
+        return False
+    bitmap_bytes = (num_docs + 7) // 8
+    if not compressed:
+        return bitmap_bytes <= 4 * len(postings)
+    if isinstance(postings, CompressedPostings):
+        return bitmap_bytes <= postings.encoded_bytes()
+    return bitmap_bytes <= vbyte_size(postings)
+
+
+def bitmap_intersection(listA, listB):
+    """
+    Intersection where at least one side is a bitmap: a bitwise AND of two bitmaps,
+    or a membership test of every doc id of a sorted list.
+    """
+    if is_bitmap(listA) and is_bitmap(listB):
+        return decode_bits(listA.to_int() & listB.to_int())
+    if is_bitmap(listA):
+        listA, listB = listB, listA
+    return [doc_id for doc_id in listA if doc_id in listB]
+
+
+def bitmap_union(listA, listB):
+    return decode_bits(bitmap_of(listA) | bitmap_of(listB))
+
+
+def bitmap_difference(listA, listB):
+    """
+    Doc ids of listA not in listB, where at least one side is a bitmap.
+    """
+    if is_bitmap(listB) and not is_bitmap(listA):
+        return [doc_id for doc_id in listA if doc_id not in listB]
+    bits = bitmap_of(listA)
+    return decode_bits(bits & ~bitmap_of(listB))
+
+
+def bitmap_complement(num, postings):
+    """
+    All doc ids in [0, num) that are not in the bitmap.
+    """
+    return decode_bits(((1 << num) - 1) & ~postings.to_int())
+
+
+class _ListBlocks:
+    """
+    Exposes a plain sorted list through the block interface of CompressedPostings (a single block).
+    """
+    __slots__ = ("postings",)
+
+    def __init__(self, postings):
+        self.postings = postings
+
+    def block_count(self):
+        return 1 if self.postings else 0
+
+    def block_bounds(self, i):
+        return self.postings[0], self.postings[-1]
+
+    def decode_block(self, i):
+        return self.postings
+
+
+def as_blocks(postings):
+    if isinstance(postings, CompressedPostings):
+        return postings
+    return _ListBlocks(postings)
+
+
+def gallop_to(postings, target, lo=0):
+    """
+    Index of the first element of the sorted list `postings` at or after `lo` that is >= `target`.
+    Probes lo+1, lo+2, lo+4, ... and then binary searches the last range, so the cost is
+    logarithmic in the distance skipped.
+    """
+    n = len(postings)
+    if lo >= n or postings[lo] >= target:
+        return lo
+    step = 1
+    hi = lo + 1
+    while hi < n and postings[hi] < target:
+        lo = hi
+        step *= 2
+        hi = lo + step
+    return bisect_left(postings, target, lo + 1, min(hi, n))
+
+
+class PostingsCursor:
+    """
+    Forward-only cursor over a postings list (list or CompressedPostings)
+    that can jump to the first doc id >= some target.
+    """
+    __slots__ = ("postings", "compressed", "block", "decoded", "pos")
+
+    def __init__(self, postings):
+        self.postings = postings
+        self.compressed = isinstance(postings, CompressedPostings)
+        self.block = 0
+        self.pos = 0
+        if self.compressed:
+            self.decoded = postings.decode_block(0) if postings.block_count() else []
+        else:
+            self.decoded = postings
+
+    def next_geq(self, target):
+        """
+        Move to the first doc id >= `target` and return it, or None when the list is exhausted.
+        """
+        if self.compressed and self.decoded and self.decoded[-1] < target:
+            # follow the skip pointers to the block that may hold target
+            self.block = self.postings.find_block(target, self.block + 1)
+            self.decoded = self.postings.decode_block(self.block) if self.block < self.postings.block_count() else []
+            self.pos = 0
+        self.pos = gallop_to(self.decoded, target, self.pos)
+        if self.pos < len(self.decoded):
+            return self.decoded[self.pos]
+        return None
+
+
+def intersect_galloping(short, long):
+    """
+    Intersection driven by the shorter list: every doc id of `short` is searched for
+    in `long` with galloping search (or skip pointers for compressed postings).
+    Costs O(len(short) * log(len(long))).
+    """
+    results = []
+    cursor = PostingsCursor(long)
+    for doc_id in short:
+        found = cursor.next_geq(doc_id)
+        if found is None:
+            break
+        if found == doc_id:
+            results.append(doc_id)
+    return results
+
+
+def difference_galloping(listA, listB):
+    """
+    Doc ids of `listA` that are not in `listB`, searching each one in `listB`
+    with galloping search (or skip pointers for compressed postings).
+    """
+    results = []
+    cursor = PostingsCursor(listB)
+    for doc_id in listA:
+        if cursor.next_geq(doc_id) != doc_id:
+            results.append(doc_id)
+    return results
+
+
+def intersect_many(postings_lists):
+    """
+    Intersection of any number of postings lists, driven by the shortest one.
+    """
+    if not postings_lists:
+        return []
+    bitmaps = [postings for postings in postings_lists if is_bitmap(postings)]
+    if bitmaps:
+        # AND the bitmaps word by word, then filter the sorted lists through the result
+        bits = bitmaps[0].to_int()
+        for bitmap in bitmaps[1:]:
+            bits &= bitmap.to_int()
+        lists = [postings for postings in postings_lists if not is_bitmap(postings)]
+        if not lists:
+            return decode_bits(bits)
+        bits = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        return [doc_id for doc_id in intersect_many(lists)
+                if doc_id >> 3 < len(bits) and bits[doc_id >> 3] >> (doc_id & 7) & 1]
+    postings_lists = sorted(postings_lists, key=len)
+    shortest, others = postings_lists[0], postings_lists[1:]
+    if not others:
+        return list(shortest)
+    cursors = [PostingsCursor(postings) for postings in others]
+    results = []
+    for doc_id in shortest:
+        for cursor in cursors:
+            found = cursor.next_geq(doc_id)
+            if found is None:
+                return results
+            if found != doc_id:
+                break
+        else:
+            results.append(doc_id)
+    return results
+
+
+def merge_many(postings_lists):
+    """
+    Union of any number of postings lists as a single k-way heap merge, instead of
+    pairwise unions that copy the growing result once per list.
+    """
+    lists = [postings for postings in postings_lists if not is_bitmap(postings)]
+    results = []
+    last = -1
+    for doc_id in heapq.merge(*lists):
+        if doc_id != last:
+            results.append(doc_id)
+            last = doc_id
+    bitmaps = [postings for postings in postings_lists if is_bitmap(postings)]
+    if bitmaps:
+        # OR the bitmaps word by word, with the merged lists as one more bitmap
+        bits = bitmap_of(results)
+        for bitmap in bitmaps:
+            bits |= bitmap.to_int()
+        return decode_bits(bits)
+    return results
+
+
+def intersect_blocks(listA, listB):
+    """
+    Intersection of two postings lists, decoding only the blocks whose ranges overlap.
+    """
+    a, b = as_blocks(listA), as_blocks(listB)
+    results = []
+    ia, ib = 0, 0
+    na, nb = a.block_count(), b.block_count()
+    decoded_a = decoded_b = None
+
+    while ia < na and ib < nb:
+        lower_a, upper_a = a.block_bounds(ia)
+        lower_b, upper_b = b.block_bounds(ib)
+        # skip blocks that cannot contain a common doc id without decoding them
+        if upper_a < lower_b:
+            ia += 1
+            decoded_a = None
+            continue
+        if upper_b < lower_a:
+            ib += 1
+            decoded_b = None
+            continue
+
+        if decoded_a is None:
+            decoded_a = a.decode_block(ia)
+        if decoded_b is None:
+            decoded_b = b.decode_block(ib)
+        i, j = 0, 0
+        while i < len(decoded_a) and j < len(decoded_b):
+            if decoded_a[i] < decoded_b[j]:
+                i += 1
+            elif decoded_a[i] > decoded_b[j]:
+                j += 1
+            else:
+                results.append(decoded_a[i])
+                i += 1
+                j += 1
+
+        # move past the block that ends first
+        if upper_a <= upper_b:
+            ia += 1
+            decoded_a = None
+        if upper_b <= upper_a:
+            ib += 1
+            decoded_b = None
+
+    return results
+
+
+def union_blocks(listA, listB):
+    """
+    Union of two postings lists, decoding one block of each side at a time.
+    """
+    a, b = as_blocks(listA), as_blocks(listB)
+    results = []
+    ia, ib = 0, 0
+    na, nb = a.block_count(), b.block_count()
+    decoded_a = a.decode_block(0) if na else []
+    decoded_b = b.decode_block(0) if nb else []
+    i, j = 0, 0
+
+    while ia < na and ib < nb:
+        x, y = decoded_a[i], decoded_b[j]
+        if x < y:
+            results.append(x)
+            i += 1
+        elif x > y:
+            results.append(y)
+            j += 1
+        else:
+            results.append(x)
+            i += 1
+            j += 1
+        if i == len(decoded_a):
+            ia += 1
+            i = 0
+            decoded_a = a.decode_block(ia) if ia < na else []
+        if j == len(decoded_b):
+            ib += 1
+            j = 0
+            decoded_b = b.decode_block(ib) if ib < nb else []
+
+    # Add remaining blocks from either list
+    results.extend(decoded_a[i:])
+    for k in range(ia + 1, na):
+        results.extend(a.decode_block(k))
+    results.extend(decoded_b[j:])
+    for k in range(ib + 1, nb):
+        results.extend(b.decode_block(k))
+
+    return results
+
+
+def memory_report(index, num_docs):
+    """
+    Compare the memory held by the postings of `index` (term -> postings) with the
+    memory the same postings take as Python lists of ints.
+
+    Returns a dictionary with the sizes in bytes.
+    """
+    total_postings = 0
+    list_bytes = 0
+    postings_bytes = 0
+    has_lists = False
+    for postings in index.values():
+        n = len(postings)
+        total_postings += n
+        # list object with one pointer per posting
+        list_bytes += sys.getsizeof([]) + 8 * n
+        if isinstance(postings, list):
+            postings_bytes += sys.getsizeof([]) + 8 * n
+            has_lists = True
+        elif isinstance(postings, array):
+            postings_bytes += sys.getsizeof(postings)
+        else:
+            postings_bytes += postings.nbytes()
+    # every document id is a boxed int shared by the lists of its terms
+    int_bytes = num_docs * sys.getsizeof(2 ** 20)
+    list_bytes += int_bytes
+    if has_lists:
+        postings_bytes += int_bytes
+
+    return {
+        "terms": len(index),
+        "postings": total_postings,
+        "list_bytes": list_bytes,
+        "postings_bytes": postings_bytes,
+        "list_bytes_per_posting": list_bytes / total_postings if total_postings else 0.0,
+        "postings_bytes_per_posting": postings_bytes / total_postings if total_postings else 0.0,
+    }
@@ -0,0 +1,317 @@
+import math
+import re
+
+OPERATORS = {"AND", "OR", "NOT", "PHRASE"}
+# NEAR/k: both terms within k positions of each other
+NEAR_OPERATOR = re.compile(r"NEAR/(\d+)")
+
+
+# Every node has a key(): a canonical string of the sub-expression (operands of AND/OR
+# sorted), so equal sub-expressions of different queries have the same key.
+
+class Term:
+    def __init__(self, term):
+        self.term = term
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return self.term
+
+    def label(self):
+        return f"TERM {self.term}"
+
+
+class Wildcard:
+    """
+    A wildcard term ("term*", "*term" or "te*rm"): the OR of every term it expands to.
+    The postings of the expanded terms are filled in by the planner.
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.postings = []
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return self.pattern
+
+    def label(self):
+        return f"WILDCARD {self.pattern} ({len(self.postings)} terms)"
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return f"(NOT {self.child.key()})"
+
+    def label(self):
+        return "NOT"
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return "(AND " + " ".join(sorted(child.key() for child in self.children)) + ")"
+
+    def label(self):
+        return "AND"
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return "(OR " + " ".join(sorted(child.key() for child in self.children)) + ")"
+
+    def label(self):
+        return "OR"
+
+
+class AndNot:
+    """
+    Documents of `positive` that are in none of `negatives`,
+    evaluated as a set difference instead of materializing NOT over the collection.
+    """
+    def __init__(self, positive, negatives):
+        self.positive = positive
+        self.negatives = negatives
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return "(ANDNOT " + self.positive.key() + " " + " ".join(sorted(child.key() for child in self.negatives)) + ")"
+
+    def label(self):
+        return "AND NOT (set difference)"
+
+
+class Phrase:
+    """
+    Documents where the terms occur consecutively, in order.
+    Evaluated as an AND of the terms whose surviving documents have their positions checked.
+    """
+    def __init__(self, terms):
+        self.terms = terms
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return "(PHRASE " + " ".join(term.key() for term in self.terms) + ")"
+
+    def label(self):
+        return "PHRASE " + " ".join(term.term for term in self.terms)
+
+
+class Near:
+    """
+    Documents where the two terms occur at most `distance` positions apart, in any order.
+    """
+    def __init__(self, terms, distance):
+        self.terms = terms
+        self.distance = distance
+        self.estimate = 0
+        self.cost = 0
+
+    def key(self):
+        return f"(NEAR/{self.distance} " + " ".join(sorted(term.key() for term in self.terms)) + ")"
+
+    def label(self):
+        return f"NEAR/{self.distance} " + " ".join(term.term for term in self.terms)
+
+
+def children_of(node):
+    if isinstance(node, (And, Or)):
+        return node.children
+    if isinstance(node, Not):
+        return [node.child]
+    if isinstance(node, AndNot):
+        return [node.positive] + node.negatives
+    if isinstance(node, (Phrase, Near)):
+        return node.terms
+    return []
+
+
+def iter_nodes(node):
+    """
+    Yields every node of the tree, parents before their children.
+    """
+    yield node
+    for child in children_of(node):
+        yield from iter_nodes(child)
+
+
+def parse_rpn(tokens):
+    """
+    Build an expression tree from a query in reverse polish notation.
+    Like the stack evaluation, the result is the top of the stack;
+    operands left below it (e.g. "telescope space NOT hubble AND") are ignored.
+    Positional operators take terms: "southwest airlines PHRASE" (chained for longer
+    phrases, "new york city PHRASE PHRASE" or "new york PHRASE city PHRASE")
+    and "cancer death NEAR/5".
+    """
+    stack = []
+    for token in tokens:
+        near = NEAR_OPERATOR.fullmatch(token)
+        if near:
+            if len(stack) < 2:
+                raise ValueError(f"{token} is missing its operands")
+            right = stack.pop()
+            left = stack.pop()
+            if not isinstance(left, Term) or not isinstance(right, Term):
+                raise ValueError(f"{token} operands must be terms")
+            stack.append(Near([left, right], int(near.group(1))))
+        elif token not in OPERATORS:
+            stack.append(Wildcard(token) if "*" in token else Term(token))
+        elif token == "NOT":
+            if not stack:
+                raise ValueError("NOT is missing its operand")
+            stack.append(Not(stack.pop()))
+        else:
+            if len(stack) < 2:
+                raise ValueError(f"{token} is missing its operands")
+            right = stack.pop()
+            left = stack.pop()
+            if token == "PHRASE":
+                stack.append(Phrase(phrase_terms(left) + phrase_terms(right)))
+            else:
+                stack.append(And([left, right]) if token == "AND" else Or([left, right]))
+
+    return stack.pop() if stack else None
+
+
+def phrase_terms(node):
+    if isinstance(node, Term):
+        return [node]
+    if isinstance(node, Phrase):
+        return node.terms
+    raise ValueError("PHRASE operands must be terms or phrases")
+
+
+class QueryPlanner:
+    """
+    Turns RPN boolean queries into an optimized expression tree:
+    nested AND/OR are flattened into n-ary operators, NOT NOT is removed,
+    A AND NOT B becomes a set difference, and operands are ordered by their
+    estimated posting list length (shortest first).
+    """
+    def __init__(self, document_frequency, num_docs, expand_postings=None):
+        """
+        document_frequency(term) returns the length of the term's postings list,
+        num_docs() returns the number of documents in the collection,
+        expand_postings(pattern) returns the postings of the terms matching a wildcard term.
+        """
+        self.document_frequency = document_frequency
+        self.num_docs = num_docs
+        self.expand_postings = expand_postings
+
+    def plan(self, tokens):
+        tree = parse_rpn(tokens)
+        if tree is None:
+            return None
+        tree = self.rewrite(tree)
+        self.annotate(tree)
+        return tree
+
+    def rewrite(self, node):
+        if isinstance(node, (Term, Wildcard, Phrase, Near)):
+            return node
+
+        if isinstance(node, Not):
+            child = self.rewrite(node.child)
+            # NOT NOT A = A
+            if isinstance(child, Not):
+                return child.child
+            return Not(child)
+
+        children = []
+        for child in node.children:
+            child = self.rewrite(child)
+            # flatten (A AND B) AND C into AND(A, B, C), same for OR
+            if type(child) is type(node):
+                children.extend(child.children)
+            else:
+                children.append(child)
+
+        if isinstance(node, Or):
+            return Or(children)
+
+        positives = [child for child in children if not isinstance(child, Not)]
+        negatives = [child.child for child in children if isinstance(child, Not)]
+        if not negatives:
+            return And(positives)
+        if not positives:
+            # NOT A AND NOT B = NOT (A OR B)
+            return Not(negatives[0] if len(negatives) == 1 else Or(negatives))
+        positive = positives[0] if len(positives) == 1 else And(positives)
+        return AndNot(positive, negatives)
+
+    def annotate(self, node):
+        """
+        Fill the estimated result size and cost of every node (bottom up) and order
+        the operands of n-ary operators by estimated size.
+        Sizes are estimated assuming terms occur independently, the cost counts the
+        postings read and written by each operator.
+        """
+        n = max(self.num_docs(), 1)
+        for child in children_of(node):
+            self.annotate(child)
+        children_cost = sum(child.cost for child in children_of(node))
+
+        if isinstance(node, Term):
+            node.estimate = self.document_frequency(node.term)
+            node.cost = 0
+        elif isinstance(node, Wildcard):
+            if self.expand_postings is None:
+                raise ValueError("This index does not support wildcard terms")
+            node.postings = self.expand_postings(node.pattern)
+            # the k-way merge reads every postings list once
+            frequencies = sum(len(postings) for postings in node.postings)
+            node.estimate = min(frequencies, n)
+            node.cost = frequencies
+        elif isinstance(node, Not):
+            node.estimate = n - node.child.estimate
+            node.cost = children_cost + n
+        elif isinstance(node, And):
+            node.children.sort(key=lambda child: child.estimate)
+            shortest, longest = node.children[0].estimate, node.children[-1].estimate
+            node.estimate = n * math.prod(child.estimate / n for child in node.children)
+            # driven by the shortest list, each candidate is searched in the other lists
+            node.cost = children_cost + shortest * (len(node.children) - 1) * max(math.log2(longest + 1), 1)
+        elif isinstance(node, Or):
+            node.children.sort(key=lambda child: child.estimate)
+            node.estimate = n * (1 - math.prod(1 - child.estimate / n for child in node.children))
+            node.cost = children_cost + sum(child.estimate for child in node.children) + node.estimate
+        elif isinstance(node, AndNot):
+            node.negatives.sort(key=lambda child: child.estimate)
+            node.estimate = node.positive.estimate * math.prod(1 - child.estimate / n for child in node.negatives)
+            node.cost = children_cost + node.positive.estimate + sum(child.estimate for child in node.negatives)
+        elif isinstance(node, (Phrase, Near)):
+            # estimated as the AND of the terms (an upper bound), plus decoding the
+            # positions of every term in each document that survives it
+            estimates = sorted(term.estimate for term in node.terms)
+            node.estimate = n * math.prod(estimate / n for estimate in estimates)
+            node.cost = (children_cost + estimates[0] * (len(estimates) - 1) * max(math.log2(estimates[-1] + 1), 1)
+                         + node.estimate * len(estimates))
+
+    def explain(self, node, depth=0):
+        """
+        Returns the plan as an indented tree with the estimated size and cost of every node.
+        """
+        if node is None:
+            return "(empty query)"
+        lines = [f"{'  ' * depth}{node.label()}  (est. rows={node.estimate:.0f}, cost={node.cost:.0f})"]
+        for child in children_of(node):
+            lines.append(self.explain(child, depth + 1))
+        return "\n".join(lines)
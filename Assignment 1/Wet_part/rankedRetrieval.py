@@ -0,0 +1,290 @@
+from collections import Counter
+import heapq
+import math
+import os
+from corpusReader import IngestStats
+from invertedIndex import InvertedIndex
+from parallelIndexer import build_index
+from postings import gallop_to
+
+# same BM25 parameters as the Lucene runs of the Final Project
+K1 = 0.9
+B = 0.4
+# doc id of an exhausted cursor, sorts after every document
+END = math.inf
+
+
+class BM25:
+    """
+    BM25 as scored by Lucene: idf(df) * tf / (tf + k1 * (1 - b + b * dl / avgdl)),
+    with idf(df) = log(1 + (N - df + 0.5) / (df + 0.5)).
+    The length normalization of every document is computed once.
+    """
+    def __init__(self, doc_lengths, k1=K1, b=B):
+        num_docs = len(doc_lengths)
+        avg_doc_length = sum(doc_lengths) / num_docs if num_docs else 1.0
+        self.num_docs = num_docs
+        self.norms = [k1 * (1 - b + b * doc_length / avg_doc_length) for doc_length in doc_lengths]
+
+    def idf(self, doc_frequency):
+        return math.log(1 + (self.num_docs - doc_frequency + 0.5) / (doc_frequency + 0.5))
+
+    def max_term_score(self, postings):
+        """
+        The highest tf / (tf + norm) over the postings of a term (the score bound without idf).
+        """
+        norms = self.norms
+        return max(frequency / (frequency + norms[doc_id])
+                   for doc_id, frequency in zip(postings.doc_ids, postings.frequencies))
+
+
+class TermCursor:
+    """
+    Document-at-a-time cursor over the FrequencyPostings of a query term.
+    """
+    __slots__ = ("doc_ids", "frequencies", "pos", "doc", "weight", "upper_bound")
+
+    def __init__(self, postings, weight, upper_bound):
+        self.doc_ids = postings.doc_ids
+        self.frequencies = postings.frequencies
+        self.pos = 0
+        self.doc = self.doc_ids[0] if self.doc_ids else END
+        self.weight = weight # idf times the number of times the term is in the query
+        self.upper_bound = upper_bound # the highest score the term gives any document
+
+    def next(self):
+        self.pos += 1
+        self.doc = self.doc_ids[self.pos] if self.pos < len(self.doc_ids) else END
+
+    def next_geq(self, target):
+        self.pos = gallop_to(self.doc_ids, target, self.pos)
+        self.doc = self.doc_ids[self.pos] if self.pos < len(self.doc_ids) else END
+
+    def score(self, norm):
+        frequency = self.frequencies[self.pos]
+        return self.weight * frequency / (frequency + norm)
+
+
+class TopK:
+    """
+    The k best (score, doc id) seen so far, in a min-heap. Equal scores are ordered by
+    doc id, so every method returns exactly the same top k.
+    """
+    def __init__(self, k):
+        self.k = k
+        self.heap = [] # (score, -doc id), the worst entry first
+        self.threshold = 0.0 # score a new document must beat to get in
+
+    def push(self, score, doc_id):
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (score, -doc_id))
+        elif score > self.threshold:
+            heapq.heapreplace(self.heap, (score, -doc_id))
+        else:
+            return
+        if len(self.heap) == self.k:
+            self.threshold = self.heap[0][0]
+
+    def results(self):
+        return [(-negative_doc_id, score) for score, negative_doc_id in sorted(self.heap, reverse=True)]
+
+
+class RankedRetrieval:
+    """
+    Top-k BM25 retrieval on an InvertedIndex built with frequencies=True.
+
+    Queries are bags of words, tokenized like the documents. "wand" and "maxscore"
+    evaluate them document at a time with dynamic pruning: each term has an upper bound
+    on the score it can add to a document, and documents (or whole runs of postings)
+    whose bounds cannot beat the k-th best score so far are skipped without being scored.
+    "exhaustive" scores every posting and is kept as a reference.
+    The per-term bounds are computed once per term and reused by later queries.
+    """
+    METHODS = ("wand", "maxscore", "exhaustive")
+
+    def __init__(self, inverted_index, k1=K1, b=B):
+        if getattr(inverted_index, "doc_lengths", None) is None:
+            raise ValueError("Ranked retrieval needs an InvertedIndex built with frequencies=True")
+        self.inverted_index = inverted_index
+        self.k1 = k1
+        self.b = b
+        self.version = None
+        self.scorer = None
+        self.upper_bounds = {} # term -> max_term_score
+        self.stats = Counter()
+
+    def refresh(self):
+        # the collection statistics change whenever documents are added
+        if self.inverted_index.version != self.version:
+            self.scorer = BM25(self.inverted_index.doc_lengths, self.k1, self.b)
+            self.upper_bounds = {}
+            self.version = self.inverted_index.version
+
+    def cursors(self, query):
+        cursors = []
+        for term, query_frequency in Counter(query.split()).items():
+            postings = self.inverted_index.get_frequencies(term)
+            if not len(postings):
+                continue
+            if term not in self.upper_bounds:
+                self.upper_bounds[term] = self.scorer.max_term_score(postings)
+            weight = query_frequency * self.scorer.idf(len(postings))
+            cursors.append(TermCursor(postings, weight, weight * self.upper_bounds[term]))
+        return cursors
+
+    def search(self, query, k=1000, method="wand"):
+        """
+        Returns the k best documents for the query as (doc name, score), best first.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown top-k method '{method}'")
+        self.refresh()
+        cursors = self.cursors(query)
+        top = TopK(k)
+        self.stats["queries"] += 1
+        self.stats["postings"] += sum(len(cursor.doc_ids) for cursor in cursors)
+        if cursors and k > 0:
+            getattr(self, method)(cursors, top)
+        return [(self.inverted_index.doc_ids[doc_id], score) for doc_id, score in top.results()]
+
+    def search_stats(self):
+        """
+        Number of queries, postings of their terms, and postings actually scored.
+        """
+        stats = dict(self.stats)
+        stats["scored_fraction"] = stats["scored"] / stats["postings"] if stats.get("postings") else 0.0
+        return stats
+
+    def exhaustive(self, cursors, top):
+        norms = self.scorer.norms
+        contributions = {}
+        for cursor in cursors:
+            while cursor.doc is not END:
+                contributions.setdefault(cursor.doc, []).append(cursor.score(norms[cursor.doc]))
+                cursor.next()
+            self.stats["scored"] += len(cursor.doc_ids)
+        for doc_id in sorted(contributions):
+            top.push(math.fsum(contributions[doc_id]), doc_id)
+
+    def wand(self, cursors, top):
+        """
+        WAND: with the cursors sorted by their current document, the pivot is the first
+        cursor at which the sum of the upper bounds so far beats the threshold. No document
+        before the pivot's can make the top k, so the cursors before it skip straight to it.
+        """
+        norms = self.scorer.norms
+        scored = 0
+        while cursors:
+            cursors.sort(key=lambda cursor: cursor.doc)
+            bound = 0.0
+            pivot = None
+            for i, cursor in enumerate(cursors):
+                bound += cursor.upper_bound
+                if bound > top.threshold:
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            pivot_doc = cursors[pivot].doc
+            if cursors[0].doc == pivot_doc:
+                # every cursor up to the pivot is on the pivot document, score it
+                norm = norms[pivot_doc]
+                contributions = []
+                for cursor in cursors:
+                    if cursor.doc != pivot_doc:
+                        break
+                    contributions.append(cursor.score(norm))
+                    cursor.next()
+                scored += len(contributions)
+                top.push(math.fsum(contributions), pivot_doc)
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.next_geq(pivot_doc)
+            cursors = [cursor for cursor in cursors if cursor.doc is not END]
+        self.stats["scored"] += scored
+
+    def maxscore(self, cursors, top):
+        """
+        MaxScore: the terms sorted by upper bound are split into non-essential ones (whose
+        bounds together cannot beat the threshold) and essential ones. Only documents of
+        the essential terms are candidates; the non-essential terms are then looked up,
+        highest bound first, until the candidate cannot make the top k.
+        """
+        norms = self.scorer.norms
+        scored = 0
+        cursors = sorted(cursors, key=lambda cursor: cursor.upper_bound)
+        bounds = [] # bounds[i]: sum of the upper bounds of cursors[0..i]
+        for cursor in cursors:
+            bounds.append((bounds[-1] if bounds else 0.0) + cursor.upper_bound)
+        essential = 0
+        while essential < len(cursors) and bounds[essential] <= top.threshold:
+            essential += 1
+
+        while essential < len(cursors):
+            doc_id = min(cursor.doc for cursor in cursors[essential:])
+            if doc_id is END:
+                break
+            norm = norms[doc_id]
+            contributions = []
+            for cursor in cursors[essential:]:
+                if cursor.doc == doc_id:
+                    contributions.append(cursor.score(norm))
+                    cursor.next()
+            score = sum(contributions)
+            for i in range(essential - 1, -1, -1):
+                if score + bounds[i] <= top.threshold:
+                    break
+                cursor = cursors[i]
+                cursor.next_geq(doc_id)
+                if cursor.doc == doc_id:
+                    contribution = cursor.score(norm)
+                    contributions.append(contribution)
+                    score += contribution
+            else:
+                top.push(math.fsum(contributions), doc_id)
+            scored += len(contributions)
+            while essential < len(cursors) and bounds[essential] <= top.threshold:
+                essential += 1
+        self.stats["scored"] += scored
+
+
+def read_queries(queries_path):
+    """
+    Queries file with one "query id<TAB>query text" per line.
+    """
+    queries = []
+    with open(queries_path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split("\t")
+            if len(parts) == 2:
+                queries.append((parts[0], parts[1]))
+    return queries
+
+
+def main():
+    curr_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(curr_dir, "data")
+    queries_path = os.path.join(curr_dir, "queriesROBUST.txt")
+
+    if not os.path.exists(data_dir) or not os.path.isdir(data_dir):
+        print("No 'data' folder found")
+        return
+    if not os.path.exists(queries_path):
+        print("No 'queriesROBUST.txt' file found")
+        return
+
+    index = InvertedIndex(backend="compressed", frequencies=True)
+    stats = IngestStats()
+    build_index(index, data_dir, workers=os.cpu_count() or 1, stats=stats)
+    print(stats.report())
+    index.optimize()
+
+    ranked_retrieval = RankedRetrieval(index)
+    with open("ranked.res", "w") as f:
+        for query_id, query_text in read_queries(queries_path):
+            for rank, (docno, score) in enumerate(ranked_retrieval.search(query_text, k=1000), 1):
+                f.write(f"{query_id} Q0 {docno:<17} {rank:<4} {score:<20.6f} run_bm25\n")
+    print(ranked_retrieval.search_stats())
+
+if __name__ == "__main__":
+    main()
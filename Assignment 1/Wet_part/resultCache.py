@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import sys
+from queryPlanner import Term
+
+# rough size of a boxed doc id held by a cached list
+INT_BYTES = sys.getsizeof(2 ** 20)
+
+
+def estimate_size(value):
+    """
+    Approximate number of bytes held by a cached value.
+    """
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + INT_BYTES * len(value)
+    if hasattr(value, "nbytes"):
+        # a method of the postings classes, an attribute of numpy arrays
+        nbytes = value.nbytes
+        return nbytes() if callable(nbytes) else nbytes
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Least recently used cache bounded by the estimated memory of its values.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        size = estimate_size(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        # evict the least recently used entries until the cache fits
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class QueryResultCache:
+    """
+    Two level cache for BooleanRetrieval:
+    results maps a normalized query to its final result, postings maps the key of a
+    sub-expression of the query plan to its postings, so different queries that share
+    a sub-expression reuse it. Both levels are cleared when the index version changes.
+    """
+    def __init__(self, max_bytes, postings_share=0.75):
+        self.results = LRUCache(int(max_bytes * (1 - postings_share)))
+        self.postings = LRUCache(int(max_bytes * postings_share))
+        self.version = None
+        self.invalidations = 0
+
+    def check_version(self, version):
+        """
+        Drop every cached entry if the index changed since they were cached.
+        """
+        if version != self.version:
+            if self.version is not None:
+                self.invalidations += 1
+            self.results.clear()
+            self.postings.clear()
+            self.version = version
+
+    # the sub-expression protocol of BooleanRetrieval.evaluate
+
+    def get(self, key, node):
+        # term postings already live in the index, only intermediate results are cached
+        if isinstance(node, Term):
+            return None
+        return self.postings.get(key)
+
+    def put(self, key, node, result):
+        if not isinstance(node, Term):
+            self.postings.put(key, result)
+
+    def stats(self):
+        return {
+            "results": self.results.stats(),
+            "postings": self.postings.stats(),
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,344 @@
+from bisect import bisect_right
+import heapq
+import json
+import math
+import os
+import shutil
+import threading
+from indexSegment import IndexSegment
+
+MANIFEST_FILE = "segments.json"
+DELETES_FILE = "deletes.bin"
+
+
+class Segment:
+    """
+    An immutable on-disk segment and the global doc id of its first document.
+    """
+    def __init__(self, name, reader, base):
+        self.name = name
+        self.reader = reader
+        self.base = base
+        self.num_docs = len(reader.doc_ids)
+
+
+class SegmentedDocNames:
+    """
+    Global doc id -> doc name over all the segments and the in-memory buffer.
+    """
+    def __init__(self, segmented_index):
+        self.segmented_index = segmented_index
+
+    def __len__(self):
+        return self.segmented_index.num_docs()
+
+    def __getitem__(self, doc_id):
+        segments, buffer, buffer_base = self.segmented_index.state()
+        if doc_id >= buffer_base:
+            return buffer.doc_ids[doc_id - buffer_base]
+        i = bisect_right([segment.base for segment in segments], doc_id) - 1
+        return segments[i].reader.doc_ids[doc_id - segments[i].base]
+
+
+class SegmentedIndex:
+    """
+    Log-structured inverted index for collections that keep growing.
+
+    New documents are added to a small in-memory InvertedIndex (the buffer) that is flushed
+    to an immutable on-disk segment once it holds `flush_threshold` documents.
+    A tiered merge policy combines `merge_factor` adjacent segments of the same size tier
+    into one, in a background thread. Deleted documents are marked in a bitmap over the
+    global doc ids, dropped from query results at once and from the postings when their
+    segment is merged.
+
+    Global doc ids are assigned in the order documents are added and never change:
+    a merged segment keeps the doc names of the deleted documents as holes, so queries
+    can run while segments are being merged.
+    Offers the same lookups as InvertedIndex, so it can be given to BooleanRetrieval.
+    """
+    def __init__(self, path, index_class, flush_threshold=10000, merge_factor=4, background=True):
+        self.path = path
+        self.index_class = index_class
+        self.flush_threshold = flush_threshold
+        self.merge_factor = merge_factor
+        self.lock = threading.RLock()
+        self.merge_condition = threading.Condition(self.lock)
+        self.segments = []
+        self.obsolete = []
+        self.next_segment = 0
+        self.deleted = bytearray()
+        self.num_deleted = 0
+        self.doc_numbers = {}  # doc name -> global doc id
+        self.buffer = index_class(backend="list")
+        self.buffer_base = 0
+        self.doc_ids = SegmentedDocNames(self)
+        self.closed = False
+        self.merging = False
+        self.version = 0 # incremented when documents are added or deleted
+
+        os.makedirs(path, exist_ok=True)
+        self.load_manifest()
+
+        self.merge_thread = None
+        if background:
+            self.merge_thread = threading.Thread(target=self.merge_loop, daemon=True)
+            self.merge_thread.start()
+
+    # Writing
+
+    def add_document(self, text, docno):
+        """
+        Add a document. Re-adding a known doc name replaces the document: the previous
+        version is marked as deleted, so queries only match the new one.
+        """
+        with self.lock:
+            previous = self.doc_numbers.get(docno[0])
+            if previous is not None:
+                self.mark_deleted(previous)
+            self.doc_numbers[docno[0]] = self.buffer_base + len(self.buffer.doc_ids)
+            self.buffer.add_document(text, docno)
+            self.version += 1
+            if len(self.buffer.doc_ids) >= self.flush_threshold:
+                self.flush()
+
+    def delete_document(self, docno):
+        """
+        Mark a document as deleted. Returns False when the doc name is unknown.
+        """
+        with self.lock:
+            doc_id = self.doc_numbers.pop(docno, None)
+            if doc_id is None:
+                return False
+            self.mark_deleted(doc_id)
+            return True
+
+    def mark_deleted(self, doc_id):
+        byte = doc_id >> 3
+        if byte >= len(self.deleted):
+            self.deleted.extend(bytes(byte + 1 - len(self.deleted)))
+        self.deleted[byte] |= 1 << (doc_id & 7)
+        self.num_deleted += 1
+        self.version += 1
+        self.save_deletes()
+
+    def is_deleted(self, doc_id):
+        byte = doc_id >> 3
+        return byte < len(self.deleted) and bool(self.deleted[byte] >> (doc_id & 7) & 1)
+
+    def flush(self):
+        """
+        Write the in-memory buffer as a new immutable segment.
+        """
+        with self.lock:
+            if not self.buffer.doc_ids:
+                return
+            name = self.new_segment_name()
+            self.buffer.save(os.path.join(self.path, name))
+            segment = Segment(name, IndexSegment(os.path.join(self.path, name)), self.buffer_base)
+            self.segments = self.segments + [segment]
+            self.buffer_base += segment.num_docs
+            self.buffer = self.index_class(backend="list")
+            self.save_manifest()
+            self.merge_condition.notify_all()
+        if self.merge_thread is None:
+            self.maybe_merge()
+
+    def new_segment_name(self):
+        name = f"segment_{self.next_segment:06d}"
+        self.next_segment += 1
+        return name
+
+    # Merging
+
+    def tier(self, segment):
+        """
+        Size tier of a segment: segments of tier t hold about flush_threshold * merge_factor^t documents.
+        """
+        ratio = max(segment.num_docs, 1) / self.flush_threshold
+        return max(0, math.floor(math.log(ratio, self.merge_factor) + 1e-9))
+
+    def find_merge(self):
+        """
+        Tiered merge policy: the first run of merge_factor adjacent segments in the same tier.
+        Only adjacent segments are merged so doc ids stay in increasing order.
+        """
+        segments = self.segments
+        for start in range(len(segments) - self.merge_factor + 1):
+            window = segments[start:start + self.merge_factor]
+            if len({self.tier(segment) for segment in window}) == 1:
+                return start, window
+        return None
+
+    def maybe_merge(self):
+        """
+        Run merges until no run of segments qualifies.
+        """
+        while True:
+            with self.lock:
+                merge = self.find_merge()
+                if merge is None or self.merging:
+                    return
+                self.merging = True
+            try:
+                self.merge_segments(*merge)
+            finally:
+                with self.lock:
+                    self.merging = False
+
+    def merge_loop(self):
+        while True:
+            with self.lock:
+                while not self.closed and self.find_merge() is None:
+                    self.merge_condition.wait()
+                if self.closed:
+                    return
+            self.maybe_merge()
+
+    def merge_segments(self, start, window):
+        """
+        Merge adjacent segments into one, dropping the postings of deleted documents.
+        The heavy work runs without the lock; only the swap of the segment list holds it.
+        """
+        merged = self.index_class(backend="list")
+        first_base = window[0].base
+        for segment in window:
+            for local_id in range(segment.num_docs):
+                merged.doc_ids[segment.base - first_base + local_id] = segment.reader.doc_ids[local_id]
+
+        streams = [self.tag_segment_postings(part, segment) for part, segment in enumerate(window)]
+        for term, _, segment, postings in heapq.merge(*streams, key=lambda entry: (entry[0], entry[1])):
+            offset = segment.base - first_base
+            live = [doc_id + offset for doc_id in postings if not self.is_deleted(doc_id + segment.base)]
+            if live:
+                merged.add_postings(term, live)
+
+        with self.lock:
+            name = self.new_segment_name()
+        merged.save(os.path.join(self.path, name))
+        segment = Segment(name, IndexSegment(os.path.join(self.path, name)), first_base)
+
+        with self.lock:
+            self.segments = self.segments[:start] + [segment] + self.segments[start + len(window):]
+            self.save_manifest()
+            self.remove_obsolete()
+            self.obsolete.extend(window)
+
+    def tag_segment_postings(self, part, segment):
+        for term, postings in segment.reader.iter_terms():
+            yield term, part, segment, postings
+
+    def remove_obsolete(self):
+        # segments replaced by a merge are removed one merge later,
+        # once queries that started before the swap are done with them
+        for segment in self.obsolete:
+            shutil.rmtree(os.path.join(self.path, segment.name), ignore_errors=True)
+        self.obsolete = []
+
+    def wait_for_merges(self):
+        """
+        Block until no merge is running or pending.
+        """
+        while True:
+            with self.lock:
+                if not self.merging and self.find_merge() is None:
+                    return
+            if self.merge_thread is None:
+                self.maybe_merge()
+            else:
+                threading.Event().wait(0.01)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.closed = True
+            self.merge_condition.notify_all()
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+        with self.lock:
+            self.remove_obsolete()
+
+    # Persistence
+
+    def save_manifest(self):
+        manifest = {
+            "next_segment": self.next_segment,
+            "segments": [{"name": segment.name, "base": segment.base} for segment in self.segments],
+        }
+        temp_path = os.path.join(self.path, MANIFEST_FILE + ".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, os.path.join(self.path, MANIFEST_FILE))
+
+    def save_deletes(self):
+        with open(os.path.join(self.path, DELETES_FILE), "wb") as f:
+            f.write(self.deleted)
+
+    def load_manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.next_segment = manifest["next_segment"]
+        for entry in manifest["segments"]:
+            reader = IndexSegment(os.path.join(self.path, entry["name"]))
+            self.segments.append(Segment(entry["name"], reader, entry["base"]))
+        if self.segments:
+            self.buffer_base = self.segments[-1].base + self.segments[-1].num_docs
+
+        deletes_path = os.path.join(self.path, DELETES_FILE)
+        if os.path.exists(deletes_path):
+            with open(deletes_path, "rb") as f:
+                self.deleted = bytearray(f.read())
+            self.num_deleted = sum(bin(byte).count("1") for byte in self.deleted)
+        for segment in self.segments:
+            for local_id in range(segment.num_docs):
+                doc_id = segment.base + local_id
+                if not self.is_deleted(doc_id):
+                    self.doc_numbers[segment.reader.doc_ids[local_id]] = doc_id
+
+    # Lookups used by BooleanRetrieval
+
+    def state(self):
+        with self.lock:
+            return self.segments, self.buffer, self.buffer_base
+
+    def num_docs(self):
+        with self.lock:
+            return self.buffer_base + len(self.buffer.doc_ids)
+
+    def get_postings(self, term):
+        """
+        Postings of the term over all live segments and the buffer, in global doc ids.
+        """
+        segments, buffer, buffer_base = self.state()
+        results = []
+        for segment in segments:
+            base = segment.base
+            results.extend(doc_id + base for doc_id in segment.reader.get_postings(term))
+        results.extend(doc_id + buffer_base for doc_id in buffer.get_postings(term))
+        if self.num_deleted:
+            results = [doc_id for doc_id in results if not self.is_deleted(doc_id)]
+        return results
+
+    def document_frequency(self, term):
+        segments, buffer, _ = self.state()
+        return sum(segment.reader.document_frequency(term) for segment in segments) + buffer.document_frequency(term)
+
+    def expand_terms(self, pattern):
+        segments, buffer, _ = self.state()
+        terms = set(buffer.expand_terms(pattern))
+        for segment in segments:
+            terms.update(segment.reader.expand_terms(pattern))
+        return sorted(terms)
+
+    def expand_postings(self, pattern):
+        return [self.get_postings(term) for term in self.expand_terms(pattern)]
+
+    def convert_from_doc_id_to_name(self, doc_id_list):
+        results = []
+        for doc_id in doc_id_list:
+            # deleted documents can still come out of NOT
+            if not self.is_deleted(doc_id):
+                results.append(self.doc_ids[doc_id])
+        return results
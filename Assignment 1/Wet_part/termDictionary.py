@@ -0,0 +1,337 @@
+from array import array
+from collections.abc import Mapping
+import heapq
+import sys
+from postings import vbyte_encode
+
+# number of terms per front coded block
+TERMS_PER_BLOCK = 16
+
+
+def vbyte_read(data, pos):
+    """
+    Decode one variable-byte number at `pos`, returns the number and the next offset.
+    """
+    n = 0
+    shift = 0
+    byte = data[pos]
+    while byte < 128:
+        n |= byte << shift
+        shift += 7
+        pos += 1
+        byte = data[pos]
+    return n | (byte & 127) << shift, pos + 1
+
+
+class FrontCodedTermTable:
+    """
+    Read-only sorted term table. Terms are stored in blocks of TERMS_PER_BLOCK:
+    the first term of a block in full, every other term as the length of the prefix
+    it shares with the previous term and the remaining suffix. Lookups binary search
+    the first terms of the blocks and decode a single block.
+    """
+    def __init__(self, terms):
+        """
+        terms: list of the terms by term id.
+        """
+        order = sorted(range(len(terms)), key=lambda term_id: terms[term_id].encode("utf-8"))
+        self.count = len(terms)
+        self.sorted_ids = array("I", order) # sorted position -> term id
+        self.positions = array("I", bytes(4 * len(terms))) # term id -> sorted position
+        self.block_offsets = array("I")
+        self.data = bytearray()
+
+        previous = b""
+        for position, term_id in enumerate(order):
+            self.positions[term_id] = position
+            term = terms[term_id].encode("utf-8")
+            if position % TERMS_PER_BLOCK == 0:
+                self.block_offsets.append(len(self.data))
+                vbyte_encode([len(term)], self.data)
+                self.data += term
+            else:
+                prefix = 0
+                limit = min(len(previous), len(term))
+                while prefix < limit and previous[prefix] == term[prefix]:
+                    prefix += 1
+                vbyte_encode([prefix, len(term) - prefix], self.data)
+                self.data += term[prefix:]
+            previous = term
+
+    def __len__(self):
+        return self.count
+
+    def first_term(self, block):
+        length, pos = vbyte_read(self.data, self.block_offsets[block])
+        return bytes(self.data[pos:pos + length])
+
+    def decode_block(self, block):
+        """
+        The terms (as utf-8 bytes) of a block, in sorted order.
+        """
+        pos = self.block_offsets[block]
+        end = self.block_offsets[block + 1] if block + 1 < len(self.block_offsets) else len(self.data)
+        length, pos = vbyte_read(self.data, pos)
+        term = bytes(self.data[pos:pos + length])
+        pos += length
+        terms = [term]
+        while pos < end:
+            prefix, pos = vbyte_read(self.data, pos)
+            length, pos = vbyte_read(self.data, pos)
+            term = term[:prefix] + self.data[pos:pos + length]
+            pos += length
+            terms.append(bytes(term))
+        return terms
+
+    def find_block(self, key):
+        """
+        The last block whose first term is <= key (0 if key sorts before every term).
+        """
+        lo, hi = 0, len(self.block_offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.first_term(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def find(self, term):
+        """
+        The sorted position of a term, or -1.
+        """
+        if not self.count:
+            return -1
+        key = term.encode("utf-8")
+        block = self.find_block(key)
+        for i, candidate in enumerate(self.decode_block(block)):
+            if candidate == key:
+                return block * TERMS_PER_BLOCK + i
+        return -1
+
+    def prefix_matches(self, prefix):
+        """
+        (term, term id) of every term starting with `prefix`, in sorted order.
+        The first block that can hold such a term is found by binary search,
+        blocks are then decoded until a term sorts after the prefix.
+        """
+        if not self.count:
+            return []
+        key = prefix.encode("utf-8")
+        results = []
+        for block in range(self.find_block(key), len(self.block_offsets)):
+            for i, term in enumerate(self.decode_block(block)):
+                if term.startswith(key):
+                    results.append((term.decode("utf-8"), self.sorted_ids[block * TERMS_PER_BLOCK + i]))
+                elif term > key:
+                    return results
+        return results
+
+    def term_at(self, position):
+        block, i = divmod(position, TERMS_PER_BLOCK)
+        return self.decode_block(block)[i].decode("utf-8")
+
+    def iter_sorted(self):
+        """
+        Yields (term, term id) in sorted term order.
+        """
+        for block in range(len(self.block_offsets)):
+            for i, term in enumerate(self.decode_block(block)):
+                yield term.decode("utf-8"), self.sorted_ids[block * TERMS_PER_BLOCK + i]
+
+    def nbytes(self):
+        return (sys.getsizeof(self.data) + sys.getsizeof(self.block_offsets)
+                + sys.getsizeof(self.sorted_ids) + sys.getsizeof(self.positions))
+
+
+class WildcardIndex:
+    """
+    Expands wildcard terms with a single "*": "term*" is a prefix range of the sorted
+    term table; "*term" is a prefix range of a second table of the reversed terms
+    (the rotation of a permuterm index that puts the end of the term first);
+    "te*rm" intersects the two.
+    """
+    def __init__(self, forward):
+        self.forward = forward
+        self.reverse = None
+
+    def reverse_table(self):
+        if self.reverse is None:
+            reversed_terms = [None] * len(self.forward)
+            for term, term_id in self.forward.iter_sorted():
+                reversed_terms[term_id] = term[::-1]
+            self.reverse = FrontCodedTermTable(reversed_terms)
+        return self.reverse
+
+    def expand(self, pattern):
+        """
+        (term, term id) of every term matching the pattern, in sorted term order.
+        """
+        prefix, _, suffix = pattern.partition("*")
+        if "*" in suffix:
+            raise ValueError(f"Wildcard term '{pattern}' has more than one '*'")
+        if not suffix:
+            return self.forward.prefix_matches(prefix)
+        ends = self.reverse_table().prefix_matches(suffix[::-1])
+        if not prefix:
+            return sorted((term[::-1], term_id) for term, term_id in ends)
+        ends = {term_id for _, term_id in ends}
+        return [(term, term_id) for term, term_id in self.forward.prefix_matches(prefix)
+                if term_id in ends and len(term) >= len(prefix) + len(suffix)]
+
+
+class TermDictionary:
+    """
+    Interns every term once into a dense integer term id (in order of first appearance).
+
+    While documents are added the dictionary is a hash map; freeze() replaces it with a
+    FrontCodedTermTable, which is much smaller and still answers lookups by binary search.
+    Adding a new term to a frozen dictionary turns it back into a hash map.
+
+    Wildcard terms are expanded with WildcardIndex segments over ranges of term ids (see
+    wildcard_segments), so terms added between wildcard queries are indexed on their own
+    instead of rebuilding the index of the whole vocabulary.
+    """
+    def __init__(self):
+        self.ids = {} # term -> term id
+        self.terms = [] # term id -> term
+        self.term_bytes = 0 # bytes held by the term strings of the hash map
+        self.table = None
+        self.wildcards = [] # (first term id, WildcardIndex) of consecutive term id ranges
+
+    def __len__(self):
+        return len(self.table) if self.table is not None else len(self.terms)
+
+    def mutable_ids(self):
+        """
+        The term -> id hash map, used by add_document to intern terms.
+        """
+        if self.table is not None:
+            self.thaw()
+        return self.ids
+
+    def intern(self, term):
+        ids = self.mutable_ids()
+        term_id = ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            ids[term] = term_id
+            self.terms.append(term)
+            self.term_bytes += sys.getsizeof(term)
+        return term_id
+
+    def get_id(self, term):
+        """
+        The id of a term, or -1 when the term is unknown.
+        """
+        if self.table is not None:
+            position = self.table.find(term)
+            return self.table.sorted_ids[position] if position != -1 else -1
+        return self.ids.get(term, -1)
+
+    def term(self, term_id):
+        if self.table is not None:
+            return self.table.term_at(self.table.positions[term_id])
+        return self.terms[term_id]
+
+    def sort_key(self):
+        """
+        A term id -> key function that orders term ids by their terms, without decoding
+        the terms of a frozen dictionary (its sorted positions are in the same order).
+        """
+        if self.table is not None:
+            return self.table.positions.__getitem__
+        return self.terms.__getitem__
+
+    def items(self):
+        """
+        Yields (term, term id) for every term (in sorted order once frozen).
+        """
+        if self.table is not None:
+            yield from self.table.iter_sorted()
+        else:
+            yield from ((term, term_id) for term_id, term in enumerate(self.terms))
+
+    def wildcard_segments(self):
+        """
+        The WildcardIndex segments covering every term, as (first term id, WildcardIndex).
+        The terms added since the last wildcard query get a segment of their own, merged
+        with the last segments while those are at most twice its size, so the segments
+        shrink geometrically (O(log vocabulary) of them) and every term is re-indexed
+        O(log vocabulary) times. A frozen dictionary uses its table as a single segment.
+        """
+        segments = self.wildcards
+        if self.table is not None:
+            if len(segments) != 1 or segments[0][1].forward is not self.table:
+                self.wildcards = [(0, WildcardIndex(self.table))]
+            return self.wildcards
+        start = segments[-1][0] + len(segments[-1][1].forward) if segments else 0
+        if start < len(self.terms):
+            while segments and len(segments[-1][1].forward) <= 2 * (len(self.terms) - start):
+                start = segments.pop()[0]
+            segments.append((start, WildcardIndex(FrontCodedTermTable(self.terms[start:]))))
+        return segments
+
+    def expand(self, pattern):
+        """
+        (term, term id) of every term matching a wildcard pattern, in sorted term order,
+        see WildcardIndex.
+        """
+        matches = [index.expand(pattern) if not start else
+                   [(term, start + term_id) for term, term_id in index.expand(pattern)]
+                   for start, index in self.wildcard_segments()]
+        return matches[0] if len(matches) == 1 else list(heapq.merge(*matches))
+
+    def freeze(self):
+        if self.table is None:
+            self.table = FrontCodedTermTable(self.terms)
+            self.ids = {}
+            self.terms = []
+            self.term_bytes = 0
+
+    def thaw(self):
+        if self.table is not None:
+            self.terms = [None] * len(self.table)
+            for term, term_id in self.table.iter_sorted():
+                self.terms[term_id] = term
+            self.ids = {term: term_id for term_id, term in enumerate(self.terms)}
+            self.term_bytes = sum(sys.getsizeof(term) for term in self.terms)
+            self.table = None
+
+    def nbytes(self):
+        """
+        Approximate number of bytes held by the dictionary.
+        """
+        if self.table is not None:
+            return self.table.nbytes()
+        return sys.getsizeof(self.ids) + sys.getsizeof(self.terms) + self.term_bytes
+
+
+class TermPostingsView(Mapping):
+    """
+    Read-only term -> postings mapping over a TermDictionary and the postings lists
+    indexed by term id, so code can keep looking postings up by term.
+    """
+    def __init__(self, terms, postings):
+        self.terms = terms
+        self.postings = postings
+
+    def __getitem__(self, term):
+        term_id = self.terms.get_id(term)
+        if term_id == -1:
+            raise KeyError(term)
+        return self.postings[term_id]
+
+    def __iter__(self):
+        for term, _ in self.terms.items():
+            yield term
+
+    def __len__(self):
+        return len(self.postings)
+
+    def items(self):
+        for term, term_id in self.terms.items():
+            yield term, self.postings[term_id]
+
+    def values(self):
+        return iter(self.postings)
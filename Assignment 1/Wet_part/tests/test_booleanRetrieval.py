@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from booleanRetrieval import BooleanRetrieval
+from invertedIndex import InvertedIndex
+
+
+def test_cached_results_follow_index_changes():
+    index = InvertedIndex()
+    index.add_document(["a b"], ["D1"])
+    retrieval = BooleanRetrieval(index, cache_bytes=1 << 20)
+    assert retrieval.process_query(["a"]) == ["D1"]
+    assert retrieval.find_matching_documents("a b AND") == "D1"
+
+    index.add_document(["a b"], ["D2"])
+    assert retrieval.process_query(["a"]) == ["D1", "D2"]
+    assert retrieval.process_query(["a", "b", "AND"]) == ["D1", "D2"]
+    assert retrieval.find_matching_documents("a b AND") == "D1 D2"
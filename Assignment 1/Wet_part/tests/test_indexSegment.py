@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indexSegment import IndexSegment
+from invertedIndex import InvertedIndex
+
+
+def make_index(documents):
+    index = InvertedIndex()
+    for docno, text in documents:
+        index.add_document([text], [docno])
+    return index
+
+
+def test_segment_records_the_corpus_fingerprint(tmp_path):
+    path = str(tmp_path / "segment")
+    make_index([("D1", "a b"), ("D2", "b c")]).save(path, "ab" * 32)
+    segment = IndexSegment(path)
+    assert segment.fingerprint == "ab" * 32
+    assert segment.get_postings("b") == [0, 1]
+
+    make_index([("D1", "a")]).save(str(tmp_path / "unknown"))
+    assert IndexSegment(str(tmp_path / "unknown")).fingerprint is None
+
+
+def test_saving_over_a_segment_replaces_it(tmp_path):
+    path = str(tmp_path / "segment")
+    make_index([("D1", "a b"), ("D2", "b c")]).save(path, "01" * 32)
+    make_index([("D3", "c d")]).save(path, "02" * 32)
+    segment = IndexSegment(path)
+    assert segment.fingerprint == "02" * 32
+    assert segment.get_postings("b") == []
+    assert segment.convert_from_doc_id_to_name(segment.get_postings("c")) == ["D3"]
+    assert sorted(os.listdir(tmp_path)) == ["segment"]
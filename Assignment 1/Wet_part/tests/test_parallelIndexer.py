@@ -0,0 +1,56 @@
+import os
+import sys
+
+WET_PART = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WET_PART)
+sys.path.insert(0, os.path.join(WET_PART, "benchmarks"))
+from corpusGenerator import generate_corpus
+from invertedIndex import InvertedIndex
+from parallelIndexer import build_index
+
+
+def build(data_dir, workers, backend):
+    index = InvertedIndex(backend=backend)
+    build_index(index, data_dir, workers=workers)
+    return index
+
+
+def test_serial_and_parallel_builds_report_the_same_terms(tmp_path):
+    # three zip files, and a small vocabulary so many terms share a document frequency
+    generate_corpus(str(tmp_path), 600, vocabulary_size=3000, doc_length=40, docs_per_file=50, files_per_zip=4)
+    for backend in ("list", "compressed"):
+        serial = build(str(tmp_path), 1, backend)
+        parallel = build(str(tmp_path), 3, backend)
+        for n in (1, 10, 100, 5000):
+            assert serial.get_top_occurrences(n) == parallel.get_top_occurrences(n)
+            assert serial.get_bottom_occurrences(n) == parallel.get_bottom_occurrences(n)
+        assert serial.get_stats() == parallel.get_stats()
+        serial.optimize()
+        parallel.optimize()
+        assert serial.get_top_occurrences(10) == parallel.get_top_occurrences(10)
+        assert serial.get_bottom_occurrences(10) == parallel.get_bottom_occurrences(10)
+
+
+def test_ties_are_ordered_by_term():
+    index = InvertedIndex()
+    index.add_document(["gamma beta", "delta alpha"], ["D1"])
+    index.add_document(["beta gamma"], ["D2"])
+    top = [index.terms.term(term_id) for term_id in index.statistics.top(4)]
+    bottom = [index.terms.term(term_id) for term_id in index.statistics.bottom(4)]
+    assert top == ["beta", "gamma", "alpha", "delta"]
+    assert bottom == ["alpha", "delta", "beta", "gamma"]
+
+
+def test_statistics_follow_documents_added_between_queries():
+    index = InvertedIndex()
+    index.add_document(["a b c"], ["D1"])
+    index.add_document(["a b"], ["D2"])
+    assert index.statistics.df_histogram() == {1: 1, 2: 2}
+    assert [index.terms.term(term_id) for term_id in index.statistics.top(2)] == ["a", "b"]
+    index.optimize()
+    index.add_document(["c d a"], ["D3"])
+    assert index.statistics.df_histogram() == {1: 1, 2: 2, 3: 1}
+    assert [index.terms.term(term_id) for term_id in index.statistics.top(2)] == ["a", "b"]
+    assert [index.terms.term(term_id) for term_id in index.statistics.bottom(2)] == ["d", "b"]
+    assert index.get_stats()["total_postings"] == 8
+    assert index.get_stats()["max_df"] == 3
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from invertedIndex import InvertedIndex
+from segmentedIndex import SegmentedIndex
+
+
+def matching_names(index, term):
+    return index.convert_from_doc_id_to_name(index.get_postings(term))
+
+
+def test_re_adding_a_document_replaces_the_old_version(tmp_path):
+    index = SegmentedIndex(str(tmp_path), InvertedIndex, flush_threshold=2, background=False)
+    index.add_document(["old text"], ["D1"])
+    index.add_document(["other text"], ["D2"])  # flushes D1 and D2 into a segment
+    index.add_document(["new text"], ["D1"])  # still in the buffer
+    assert matching_names(index, "old") == []
+    assert matching_names(index, "new") == ["D1"]
+    assert matching_names(index, "text") == ["D2", "D1"]
+
+    index.add_document(["newer"], ["D1"])  # replaces a document of the buffer
+    assert matching_names(index, "new") == []
+    assert matching_names(index, "newer") == ["D1"]
+    index.close()
+
+    reopened = SegmentedIndex(str(tmp_path), InvertedIndex, background=False)
+    assert matching_names(reopened, "text") == ["D2"]
+    assert matching_names(reopened, "newer") == ["D1"]
+    assert reopened.delete_document("D1")
+    assert matching_names(reopened, "newer") == []
+    reopened.close()
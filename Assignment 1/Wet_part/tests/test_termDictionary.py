@@ -0,0 +1,30 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from termDictionary import TermDictionary
+
+
+def matching(terms, pattern):
+    prefix, _, suffix = pattern.partition("*")
+    return sorted((term, term_id) for term_id, term in enumerate(terms)
+                  if term.startswith(prefix) and term.endswith(suffix) and len(term) >= len(prefix) + len(suffix))
+
+
+def test_wildcards_follow_terms_added_between_queries():
+    rng = random.Random(5)
+    dictionary = TermDictionary()
+    terms = []
+    for step in range(600):
+        for _ in range(rng.randint(0, 4)):
+            term = "".join(rng.choice("abcd") for _ in range(rng.randint(1, 6)))
+            if dictionary.get_id(term) == -1:
+                assert dictionary.intern(term) == len(terms)
+                terms.append(term)
+        if step == 200:
+            dictionary.freeze()
+        for pattern in ("a*", "*b", "ab*c", "*"):
+            assert dictionary.expand(pattern) == matching(terms, pattern)
+    # the terms added one query at a time are indexed in a few segments, not one per query
+    assert len(dictionary.wildcards) < 12
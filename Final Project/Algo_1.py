@@ -1,9 +1,14 @@
 from pyserini.analysis import Analyzer, get_lucene_analyzer
 from pyserini.search.lucene import LuceneSearcher, LuceneFusionSearcher
-from Reranker import load_model_and_predict, read_scores_from_files,train_reranker
+from Reranker import (feature_columns, load_model_and_predict, load_reranker, read_scores_from_files, train_reranker,
+                      training_fingerprint)
+from RetrievalCache import index_fingerprint
+from helpers import ANALYZER, THREADS, retrieve
+from Features import FeatureExtractor
 
 def algo1(queries, index_path, output_file='run_1.res', k1=0.9, b=0.4,
-          fb_terms=10, fb_docs=10, original_query_weight=0.5):
+          fb_terms=10, fb_docs=10, original_query_weight=0.5, threads=THREADS, model_path='lambdamart_run_1.txt',
+          index_features=False):
     """
     BM25 with RM3 query expansion and LambdaMART reranking.
 
@@ -16,41 +21,47 @@ def algo1(queries, index_path, output_file='run_1.res', k1=0.9, b=0.4,
         fb_terms (int): Number of feedback terms for RM3.
         fb_docs (int): Number of feedback documents for RM3.
         original_query_weight (float): Weight of the original query in RM3 expansion.
+        threads (int): Number of threads for the batched first-stage retrieval (cached on disk).
+        model_path (str, optional): Saved LambdaMART model of this algorithm, loaded instead of training
+                                    when it was trained on the same features, retrieval parameters, queries,
+                                    index and qrels, and written after training otherwise
+                                    (None: always train, without saving).
+        index_features (bool): Add index-derived features (BM25, QLD, TF-IDF, document length, query
+                               term statistics) to the reranker features; the index must store document vectors.
 
     Returns:
-        None
+        Run: Reranked results of the test queries.
     """
-    # Initialize searcher with BM25 and RM3 settings
-    searcher = LuceneSearcher(index_path)
-    analyzer = get_lucene_analyzer(stemmer='krovetz', stopwords=False)
-    searcher.set_analyzer(analyzer)
-    searcher.set_bm25(k1=k1, b=b)
-    searcher.set_rm3(fb_terms=fb_terms, fb_docs=fb_docs, original_query_weight=original_query_weight)
-
-    # Save BM25+RM3 results for training on the first 50 queries
-    train_file = 'train_res.res'
-    with open(train_file, 'w') as f_train:
-        for query_id, query_text in queries[:50]:  # First 50 queries for training
-            hits = searcher.search(query_text, k=1000)
-            for i, hit in enumerate(hits):
-                f_train.write(f"{query_id} Q0 {hit.docid:<17} {i + 1:<4} {hit.score:<20.6f} run_1_train\n")
-
-    # Train LambdaMART reranker using the first 50 queries
-    model = train_reranker([('train_res.res', 'run_1_train')])
-
-    # Perform BM25+RM3 for testing on the remaining queries and rerank
-    test_file = 'test_res.res'
-    with open(test_file, 'w') as f_test:
-        for query_id, query_text in queries[50:]:  # Remaining queries for testing
-            hits = searcher.search(query_text, k=1000)
-            for i, hit in enumerate(hits):
-                f_test.write(f"{query_id} Q0 {hit.docid:<17} {i + 1:<4} {hit.score:<20.6f} run_1_test\n")
-
-    # Read testing results and prepare for reranking
-    test_df = read_scores_from_files([('test_res.res', 'run_1_test')])
+    # BM25 and RM3 settings of the searcher
+    bm25 = {'k1': k1, 'b': b}
+    rm3 = {'fb_terms': fb_terms, 'fb_docs': fb_docs, 'original_query_weight': original_query_weight}
+
+    feature_extractor = FeatureExtractor(index_path) if index_features else None
+
+    # Perform BM25+RM3 for testing on the remaining queries; the train and test runs share
+    # their tag, which names the score and rank features
+    test_run = retrieve(queries[50:], index_path, k=1000, threads=threads, bm25=bm25, rm3=rm3, tag='run_1')
+
+    # Prepare testing results for reranking
+    test_df = read_scores_from_files([test_run])
+    if feature_extractor is not None:
+        test_df = feature_extractor.add_features(test_df, queries)
+
+    # everything the training data depends on, besides the qrels (see training_fingerprint)
+    fingerprint = training_fingerprint({'algorithm': 'algo1', 'index': index_fingerprint(index_path), 'analyzer': ANALYZER,
+                                        'bm25': bm25, 'rm3': rm3, 'index_features': index_features,
+                                        'train_queries': queries[:50]})
+    model = load_reranker(model_path, feature_columns(test_df), fingerprint)
+    if model is None:
+        # BM25+RM3 results of the first 50 queries for training
+        train_run = retrieve(queries[:50], index_path, k=1000, threads=threads, bm25=bm25, rm3=rm3, tag='run_1')
+
+        # Train LambdaMART reranker using the first 50 queries
+        model = train_reranker([train_run], model_path=model_path,
+                               feature_extractor=feature_extractor, queries=queries, fingerprint=fingerprint)
 
     # Rerank and save results for test queries
-    load_model_and_predict(model, test_df, output_file)
+    run = load_model_and_predict(model, test_df, output_file, docnos=test_run.docnos)
 
     print(f"Reranked results for test queries saved to {output_file}")
-
+    return run
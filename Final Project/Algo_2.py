@@ -1,40 +1,15 @@
 from pyserini.search.lucene import LuceneSearcher
 from pyserini.analysis import Analyzer, get_lucene_analyzer
-from collections import defaultdict
-from Reranker import load_model_and_predict, read_scores_from_files,train_reranker
+from Reranker import (feature_columns, load_model_and_predict, load_reranker, read_scores_from_files, train_reranker,
+                      training_fingerprint)
+from RetrievalCache import index_fingerprint
+from helpers import ANALYZER, THREADS, retrieve
+from Features import FeatureExtractor
+from Fusion import fuse_runs
 
-def normalize_scores(hits):
-    """
-    Normalize scores using Min-Max normalization.
-    """
-    if not hits:
-        return hits
-    scores = [hit.score for hit in hits]
-    min_score = min(scores)
-    max_score = max(scores)
-    if max_score > min_score:
-        for hit in hits:
-            hit.score = (hit.score - min_score) / (max_score - min_score)
-    else:
-        for hit in hits:
-            hit.score = 0.0
-    return hits
-
-
-def combine_scores(hits_qld, hits_bm25, weight_qld=0.7):
-    """
-    Combine scores from QLD and BM25.
-    """
-    combined_scores = defaultdict(float)
-    for hit_qld, hit_bm25 in zip(hits_qld, hits_bm25):
-        combined_scores[hit_qld.docid] += weight_qld * hit_qld.score
-        combined_scores[hit_bm25.docid] += (1 - weight_qld) * hit_bm25.score
-
-    # Sort combined scores
-    combined_hits = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
-    return combined_hits
-
-def algo2(queries, index_path, output_file='run_2.res', mu=1000, fb_terms=10, fb_docs=10, original_query_weight=0.5, hybrid_weight=0.5):
+def algo2(queries, index_path, output_file='run_2.res', mu=1000, fb_terms=10, fb_docs=10, original_query_weight=0.5, hybrid_weight=0.5,
+          normalization='minmax', fusion_method='combsum', threads=THREADS, model_path='lambdamart_run_2.txt',
+          index_features=False):
     """
     Query Likelihood with Dirichlet priors smoothing, RM3-based query expansion, and hybrid scoring.
 
@@ -46,53 +21,60 @@ def algo2(queries, index_path, output_file='run_2.res', mu=1000, fb_terms=10, fb
         fb_terms (int): Number of feedback terms for RM3.
         fb_docs (int): Number of feedback documents for RM3.
         original_query_weight (float): Weight of the original query in RM3 expansion.
-        hybrid_weight (float): Weight for combining QLD and BM25 scores.
+        hybrid_weight (float): Weight of the QLD scores when combining them with the BM25 scores.
+        normalization (str): Score normalization of both runs before combining ('minmax', 'zscore', 'sum' or 'none').
+        fusion_method (str): 'combsum', 'combmnz' or 'rrf' (see Fusion.fuse_hit_lists).
+        threads (int): Number of threads for the batched first-stage retrieval (cached on disk).
+        model_path (str, optional): Saved LambdaMART model of this algorithm, loaded instead of training
+                                    when it was trained on the same features, retrieval parameters, queries,
+                                    index and qrels, and written after training otherwise
+                                    (None: always train, without saving).
+        index_features (bool): Add index-derived features (BM25, QLD, TF-IDF, document length, query
+                               term statistics) to the reranker features; the index must store document vectors.
 
     Returns:
-        None
+        Run: Reranked results of the test queries.
     """
-    # Initialize QLD searcher
-    searcher_qld = LuceneSearcher(index_path)
-    analyzer = get_lucene_analyzer(stemmer='krovetz', stopwords=False)
-    searcher_qld.set_analyzer(analyzer)
-    searcher_qld.set_qld(mu=mu)
+    # QLD settings
+    qld = {'mu': mu}
 
-    # Initialize BM25+RM3 searcher
-    searcher_bm25 = LuceneSearcher(index_path)
-    searcher_bm25.set_analyzer(analyzer)
-    searcher_bm25.set_bm25(k1=0.9, b=0.4)
-    searcher_bm25.set_rm3(fb_terms=fb_terms, fb_docs=fb_docs, original_query_weight=original_query_weight)
+    # BM25+RM3 settings
+    bm25 = {'k1': 0.9, 'b': 0.4}
+    rm3 = {'fb_terms': fb_terms, 'fb_docs': fb_docs, 'original_query_weight': original_query_weight}
 
-    # Save combined scores for training on the first 50 queries
-    train_file = 'train_res.res'
-    with open(train_file, 'w') as f_train:
-        for query_id, query_text in queries[:50]:  # First 50 queries for training
-            hits_qld = searcher_qld.search(query_text, k=1000)
-            hits_bm25 = searcher_bm25.search(query_text, k=1000)
-            combined_hits = combine_scores(hits_qld, hits_bm25, weight_qld=hybrid_weight)
-            normalized_hits = sorted(combined_hits, key=lambda x: x[1], reverse=True)
-            for rank, (doc_id, score) in enumerate(normalized_hits, start=1):  # Write up to 1000 results
-                f_train.write(f"{query_id} Q0 {doc_id:<17} {rank:<4} {score:<20.6f} run_2_train\n")
+    feature_extractor = FeatureExtractor(index_path) if index_features else None
 
-    # Train LambdaMART reranker using the first 50 queries
-    model = train_reranker([('train_res.res', 'run_2_train')])
+    # Perform scoring for testing on the remaining queries; the train and test runs share
+    # their tag, which names the score and rank features
+    test_qld = retrieve(queries[50:], index_path, k=1000, threads=threads, qld=qld)
+    test_bm25 = retrieve(queries[50:], index_path, k=1000, threads=threads, bm25=bm25, rm3=rm3)
+    test_run = fuse_runs([test_qld, test_bm25], weights=[hybrid_weight, 1 - hybrid_weight],
+                         normalization=normalization, method=fusion_method, k=1000, tag='run_2')
 
-    # Perform scoring for testing on the remaining queries and rerank
-    test_file = 'test_res.res'
-    with open(test_file, 'w') as f_test:
-        for query_id, query_text in queries[50:]:  # Remaining queries for testing
-            hits_qld = searcher_qld.search(query_text, k=1000)
-            hits_bm25 = searcher_bm25.search(query_text, k=1000)
-            combined_hits = combine_scores(hits_qld, hits_bm25, weight_qld=hybrid_weight)
-            normalized_hits = sorted(combined_hits, key=lambda x: x[1], reverse=True)
-            for rank, (doc_id, score) in enumerate(normalized_hits[:1000], start=1):  # Write available results
-                f_test.write(f"{query_id} Q0 {doc_id:<17} {rank:<4} {score:<20.6f} run_2_test\n")
+    # Prepare testing results for reranking
+    test_df = read_scores_from_files([test_run])
+    if feature_extractor is not None:
+        test_df = feature_extractor.add_features(test_df, queries)
 
-    # Read testing results and prepare for reranking
-    test_df = read_scores_from_files([('test_res.res', 'run_2_test')])
+    # everything the training data depends on, besides the qrels (see training_fingerprint)
+    fingerprint = training_fingerprint({'algorithm': 'algo2', 'index': index_fingerprint(index_path), 'analyzer': ANALYZER,
+                                        'qld': qld, 'bm25': bm25, 'rm3': rm3, 'hybrid_weight': hybrid_weight,
+                                        'normalization': normalization, 'fusion_method': fusion_method,
+                                        'index_features': index_features, 'train_queries': queries[:50]})
+    model = load_reranker(model_path, feature_columns(test_df), fingerprint)
+    if model is None:
+        # Combined scores for training on the first 50 queries
+        train_qld = retrieve(queries[:50], index_path, k=1000, threads=threads, qld=qld)
+        train_bm25 = retrieve(queries[:50], index_path, k=1000, threads=threads, bm25=bm25, rm3=rm3)
+        train_run = fuse_runs([train_qld, train_bm25], weights=[hybrid_weight, 1 - hybrid_weight],
+                              normalization=normalization, method=fusion_method, tag='run_2')
+
+        # Train LambdaMART reranker using the first 50 queries
+        model = train_reranker([train_run], model_path=model_path,
+                               feature_extractor=feature_extractor, queries=queries, fingerprint=fingerprint)
 
     # Rerank and save results for test queries
-    load_model_and_predict(model, test_df, output_file)
+    run = load_model_and_predict(model, test_df, output_file, docnos=test_run.docnos)
 
     print(f"Reranked results for test queries saved to {output_file}")
-
+    return run
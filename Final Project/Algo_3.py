@@ -1,37 +1,100 @@
-from collections import defaultdict
+import heapq
+from itertools import groupby
+from operator import itemgetter
+from Fusion import METHODS as FUSION_METHODS, fuse_hit_lists
+from RetrievalCache import DocnoTable
+from Runs import Run, top_k_order
 
-def reciprocal_rank_fusion(run_files, k=100):
+
+def query_order(query_id):
+    # numeric query ids in numeric order, before any other id
+    return (0, int(query_id), query_id) if query_id.isdigit() else (1, 0, query_id)
+
+
+def iter_run_queries(run):
     """
-    Perform Reciprocal Rank Fusion (RRF) on multiple TREC run files.
+    Yields (query_id, [(doc_id, rank, score), ...]) for every query of a Run, in query
+    order, or of a TREC run file, which is read one query at a time.
     """
-    fused_results = defaultdict(lambda: defaultdict(float))
+    if isinstance(run, Run):
+        for i in sorted(range(len(run.query_ids)), key=lambda i: query_order(run.query_ids[i])):
+            start, end = run.offsets[i], run.offsets[i + 1]
+            yield run.query_ids[i], list(zip(run.docnos.lookup(run.doc_ids[start:end]), run.ranks[start:end].tolist(),
+                                             run.scores[start:end].tolist()))
+    else:
+        with open(run, 'r') as f:
+            lines = (line.split() for line in f)
+            for query_id, rows in groupby(lines, key=itemgetter(0)):
+                yield query_id, [(doc_id, int(rank), float(score)) for _, _, doc_id, rank, score, _ in rows]
 
-    # Read each run file and calculate RRF scores
-    for run_file in run_files:
-        with open(run_file, 'r') as f:
-            for line in f:
-                query_id, _, doc_id, rank, _, _ = line.strip().split()
-                rank = int(rank)
-                fused_results[query_id][doc_id] += 1 / (k + rank)
 
-    # Sort results for each query by descending RRF score
-    for query_id in fused_results:
-        fused_results[query_id] = sorted(
-            fused_results[query_id].items(), key=lambda x: x[1], reverse=True)
+def keyed_run_queries(run, run_index):
+    """
+    Yields (query order, run_index, query_id, ranking) for every query of a run, checking
+    that a run file is grouped by query id and sorted in query order.
+    """
+    previous = None
+    for query_id, ranking in iter_run_queries(run):
+        key = query_order(query_id)
+        if previous is not None and key <= previous[0]:
+            raise ValueError(f"{run} is not grouped by query id in query order: query {query_id} after {previous[1]}")
+        previous = (key, query_id)
+        yield key, run_index, query_id, ranking
+
+
+def iter_query_rankings(runs):
+    """
+    Yields (query_id, rankings) for the union of the query ids of all runs, in query order,
+    with one ranking per run, empty for the runs that do not have the query. The runs are
+    merged in lockstep (heapq.merge), so only the current query of every run is in memory;
+    run files must be grouped by query id in query order (numeric ids in numeric order).
+    """
+    merged = heapq.merge(*(keyed_run_queries(run, run_index) for run_index, run in enumerate(runs)))
+    for _, entries in groupby(merged, key=itemgetter(0)):
+        rankings = [[] for _ in runs]
+        for _, run_index, query_id, ranking in entries:
+            rankings[run_index] = ranking
+        yield query_id, rankings
 
-    return fused_results
+
+def stream_fusion(runs, fusion_method='rrf', fusion_k=100, k=1000):
+    """
+    Fuse any number of runs (Run objects or TREC run files) one query at a time, streaming
+    the runs in lockstep over the queries of all runs (see iter_query_rankings), with
+    Fusion.fuse_hit_lists: RRF on the ranks, CombSUM or CombMNZ on the min-max normalized scores.
+    Yields (query_id, [(doc_id, fused score), ...]) with the k best documents, best first.
+    """
+    if fusion_method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{fusion_method}', expected one of {FUSION_METHODS}")
+    for query_id, rankings in iter_query_rankings(runs):
+        docnos = DocnoTable()  # interns the doc ids of this query for fuse_hit_lists
+        doc_id_lists = [docnos.intern_many([doc_id for doc_id, _, _ in ranking]) for ranking in rankings]
+        rank_lists = [[rank for _, rank, _ in ranking] for ranking in rankings]
+        score_lists = [[score for _, _, score in ranking] for ranking in rankings]
+        doc_ids, fused_scores = fuse_hit_lists(doc_id_lists, score_lists, normalization='minmax', method=fusion_method,
+                                               rank_lists=rank_lists, rrf_k=fusion_k)
+        order = top_k_order(fused_scores, k)
+        yield query_id, list(zip(docnos.lookup(doc_ids[order]), fused_scores[order].tolist()))
+
+
+def reciprocal_rank_fusion(runs, k=100):
+    """
+    Perform Reciprocal Rank Fusion (RRF) on multiple runs (Run objects or TREC run files).
+    """
+    return dict(stream_fusion(runs, 'rrf', fusion_k=k, k=None))
 
 def algo3(queries, fusion_method, index_path, fusion_k=100,
           runs=['run_1.res', 'run_2.res'], k=1000,
           output_file='run_3.res', k1=0.9, b=0.4):
     """
-    Fuse results from multiple runs using the specified fusion method.
+    Fuse results from multiple runs (Run objects or TREC run files) using the specified fusion method
+    ('rrf', 'combsum' or 'combmnz').
     """
-
-    fused_results = reciprocal_rank_fusion(runs, k=fusion_k)
-    with open(output_file, 'w') as f:
-        for query_id, doc_scores in fused_results.items():
-            # Keep only the top k documents for each query
-            top_k_docs = doc_scores[:k]
-            for rank, (doc_id, score) in enumerate(top_k_docs, start=1):
-                f.write(f"{query_id} Q0 {doc_id} {rank} {float(score):.6f} run_3\n")
\ No newline at end of file
+    docnos = DocnoTable()
+    query_scores = []
+    for query_id, top_k_docs in stream_fusion(runs, fusion_method, fusion_k=fusion_k, k=k):
+        query_scores.append((query_id, docnos.intern_many([doc_id for doc_id, _ in top_k_docs]),
+                             [score for _, score in top_k_docs]))
+    run = Run.from_query_scores(query_scores, docnos, tag='run_3')
+    run.to_trec(output_file)
+    return run
\ No newline at end of file
@@ -0,0 +1,195 @@
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+from pyserini.analysis import get_lucene_analyzer
+from pyserini.index.lucene import IndexReader
+from helpers import ANALYZER
+
+FEATURE_NAMES = ['doc_length', 'bm25', 'qld', 'tfidf', 'matched_terms', 'matched_fraction',
+                 'query_length', 'idf_sum', 'idf_max']
+# Number of document vectors kept in memory across queries
+MAX_CACHED_DOCS = 200000
+
+
+class FeatureExtractor:
+    """
+    Index-derived reranking features of (query, document) pairs: BM25, QLD and TF-IDF
+    scores, document length, matched query terms and query term statistics.
+
+    The collection statistics are read once and term statistics once per term. The document
+    vectors of a batch of pairs are fetched once per document (pyserini's IndexReader reads
+    one document vector per call), stored compactly (sorted int32 term ids and term
+    frequencies) and kept for later batches in an LRU cache. The features of all pairs of
+    the batch are then computed together (see pair_features).
+    Needs an index built with stored document vectors (-storeDocvectors).
+    """
+    def __init__(self, index_path, k1=0.9, b=0.4, mu=1000, max_cached_docs=MAX_CACHED_DOCS):
+        self.reader = IndexReader(index_path)
+        self.analyzer = get_lucene_analyzer(**ANALYZER)
+        self.k1 = k1
+        self.b = b
+        self.mu = mu
+        stats = self.reader.stats()
+        self.num_docs = stats['documents']
+        self.total_terms = stats['total_terms']
+        self.avg_doc_length = self.total_terms / self.num_docs if self.num_docs else 1.0
+        self.term_ids = {}  # analyzed term -> id used in the cached document vectors
+        self.term_stats = {}  # analyzed term -> (df, cf)
+        self.doc_vectors = OrderedDict()  # docno -> (sorted term ids, term frequencies, length)
+        self.max_cached_docs = max_cached_docs
+
+    def term_id(self, term):
+        return self.term_ids.setdefault(term, len(self.term_ids))
+
+    def collection_stats(self, term):
+        if term not in self.term_stats:
+            self.term_stats[term] = self.reader.get_term_counts(term, analyzer=None)
+        return self.term_stats[term]
+
+    def fetch_doc_vectors(self, docnos):
+        """
+        The compact document vectors of the given documents, fetching the uncached ones
+        (the batch may hold more documents than the cache).
+        """
+        vectors = self.doc_vectors
+        batch = {}
+        for docno in docnos:
+            if docno in batch:
+                continue
+            if docno in vectors:
+                vectors.move_to_end(docno)
+                batch[docno] = vectors[docno]
+                continue
+            doc_vector = self.reader.get_document_vector(docno)
+            if doc_vector is None:
+                raise ValueError(f"No document vector for {docno}, the index must store document vectors")
+            term_ids = np.fromiter((self.term_id(term) for term in doc_vector), dtype=np.int32, count=len(doc_vector))
+            frequencies = np.fromiter(doc_vector.values(), dtype=np.int32, count=len(doc_vector))
+            order = np.argsort(term_ids)
+            vectors[docno] = batch[docno] = (term_ids[order], frequencies[order], int(frequencies.sum()))
+            if len(vectors) > self.max_cached_docs:
+                vectors.popitem(last=False)
+        return [batch[docno] for docno in docnos]
+
+    def query_terms(self, query_text):
+        """
+        The analyzed terms of a query that occur in the collection, with their query frequencies.
+        """
+        query_terms = Counter(self.reader.analyze(query_text, analyzer=self.analyzer))
+        return {term: count for term, count in query_terms.items() if self.collection_stats(term)[0] > 0}, sum(query_terms.values())
+
+    def pair_features(self, query_texts, query_codes, docnos, doc_codes):
+        """
+        Feature matrix (float32, one row per pair, columns in FEATURE_NAMES order) of a batch
+        of (query, document) pairs, given as codes into the unique query texts and docnos.
+
+        Every document is fetched once for the whole batch. The term frequencies of the
+        batch's query terms are looked up once per document and kept in a sorted array of
+        (document, term) keys, from which the (pair, query term) combinations of all queries
+        read their tf at once; the per-pair sums are computed with np.bincount.
+        """
+        features = np.zeros((len(doc_codes), len(FEATURE_NAMES)), dtype=np.float32)
+        doc_vectors = self.fetch_doc_vectors(docnos)
+        doc_lengths = np.array([length for _, _, length in doc_vectors], dtype=np.float64)
+        features[:, 0] = doc_lengths[doc_codes]
+
+        # the query terms of all queries in one flat array, query by query
+        batch_terms = {}  # analyzed term -> index in the batch vocabulary
+        term_index, query_tf, num_terms, query_lengths = [], [], [], []
+        for query_text in query_texts:
+            terms, query_length = self.query_terms(query_text)
+            term_index.extend(batch_terms.setdefault(term, len(batch_terms)) for term in terms)
+            query_tf.extend(terms.values())
+            num_terms.append(len(terms))
+            query_lengths.append(query_length)
+        term_index = np.array(term_index, dtype=np.int64)
+        query_tf = np.array(query_tf, dtype=np.float64)
+        num_terms = np.array(num_terms, dtype=np.int64)
+        features[:, 6] = np.array(query_lengths, dtype=np.float64)[query_codes]
+        if not batch_terms or not len(doc_codes):
+            return features
+
+        # tf of the batch terms in every document, as sorted (document * terms + term) keys
+        global_ids = np.array([self.term_id(term) for term in batch_terms], dtype=np.int32)
+        order = np.argsort(global_ids)
+        sorted_ids = global_ids[order]
+        keys, frequencies = [], []
+        for doc_index, (doc_term_ids, doc_frequencies, _) in enumerate(doc_vectors):
+            if not len(doc_term_ids):
+                continue
+            positions = np.minimum(np.searchsorted(doc_term_ids, sorted_ids), len(doc_term_ids) - 1)
+            found = doc_term_ids[positions] == sorted_ids
+            keys.append(doc_index * len(batch_terms) + order[found])
+            frequencies.append(doc_frequencies[positions[found]])
+        keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+        frequencies = np.concatenate(frequencies) if frequencies else np.zeros(0, dtype=np.int32)
+        key_order = np.argsort(keys)
+        keys, frequencies = keys[key_order], frequencies[key_order]
+
+        # one entry per (pair, query term): the pair's row and the position in the flat term array
+        row_terms = num_terms[query_codes]
+        rows = np.repeat(np.arange(len(doc_codes)), row_terms)
+        term_starts = np.cumsum(num_terms) - num_terms
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(row_terms) - row_terms, row_terms)
+        terms = np.repeat(term_starts[query_codes], row_terms) + within
+        pair_keys = doc_codes[rows] * len(batch_terms) + term_index[terms]
+        tf = np.zeros(len(rows), dtype=np.float64)
+        if len(keys):
+            positions = np.minimum(np.searchsorted(keys, pair_keys), len(keys) - 1)
+            found = keys[positions] == pair_keys
+            tf[found] = frequencies[positions[found]]
+
+        df, cf = (np.array(column, dtype=np.float64) for column in zip(*(self.collection_stats(term) for term in batch_terms)))
+        idf = np.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+        term_idf = idf[term_index]
+        entry_tf = query_tf[terms]
+        entry_idf = term_idf[terms]
+        lengths = doc_lengths[doc_codes[rows]]
+        norms = self.k1 * (1 - self.b + self.b * lengths / self.avg_doc_length)
+        collection_prob = (cf / self.total_terms)[term_index][terms]
+        tfidf_idf = np.log(self.num_docs / df)[term_index][terms]
+        pairs = len(doc_codes)
+        features[:, 1] = np.bincount(rows, tf / (tf + norms) * entry_idf * entry_tf, minlength=pairs)
+        features[:, 2] = np.bincount(rows, np.log((tf + self.mu * collection_prob) / (lengths + self.mu)) * entry_tf, minlength=pairs)
+        features[:, 3] = np.bincount(rows, np.log1p(tf) * tfidf_idf * entry_tf, minlength=pairs)
+        matched = np.bincount(rows, tf > 0, minlength=pairs)
+        features[:, 4] = matched
+        features[:, 5] = np.divide(matched, row_terms, out=np.zeros(pairs), where=row_terms > 0)
+
+        # idf sum and maximum of every query
+        has_terms = num_terms > 0
+        query_of_term = np.repeat(np.arange(len(num_terms)), num_terms)
+        idf_sum = np.bincount(query_of_term, term_idf, minlength=len(num_terms))
+        idf_max = np.zeros(len(num_terms))
+        idf_max[has_terms] = np.maximum.reduceat(term_idf, term_starts[has_terms])
+        features[:, 7] = idf_sum[query_codes]
+        features[:, 8] = idf_max[query_codes]
+        return features
+
+    def query_features(self, query_text, docnos):
+        """
+        Feature matrix (float32, one row per document, columns in FEATURE_NAMES order) of
+        the candidate documents of a query.
+        """
+        doc_codes, unique_docnos = pd.factorize(pd.Series(docnos, dtype=object))
+        return self.pair_features([query_text], np.zeros(len(doc_codes), dtype=np.int64), list(unique_docnos), doc_codes)
+
+    def add_features(self, df, queries):
+        """
+        Add the FEATURE_NAMES columns to a scores DataFrame (see read_scores_from_files).
+        All pairs are computed as one batch (see pair_features), so a document retrieved
+        for many queries is fetched from the index once.
+
+        Parameters:
+            df (pd.DataFrame): Scores with query_id and doc_id columns.
+            queries (list): List of tuples (query_id, query_text).
+
+        Returns:
+            pd.DataFrame: The DataFrame with the feature columns.
+        """
+        query_texts = dict(queries)
+        query_codes, query_ids = pd.factorize(df['query_id'])
+        doc_codes, docnos = pd.factorize(df['doc_id'])
+        df[FEATURE_NAMES] = self.pair_features([query_texts[query_id] for query_id in query_ids],
+                                               query_codes, list(docnos), doc_codes)
+        return df
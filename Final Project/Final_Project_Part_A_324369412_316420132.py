@@ -9,10 +9,11 @@ QRELS_PATH = r'files/qrels_50_Queries'
 
 def main():
     queries = get_queries_list(QUERIES_PATH)
-    algo1(queries, index_path=INDEX_PATH, k1=0.9, b=0.4, fb_terms=26, fb_docs=30, original_query_weight=0.7)
-    algo2(queries, index_path=INDEX_PATH, output_file='run_2.res', mu=800, fb_terms=50, fb_docs=20,
-          original_query_weight=0.7, hybrid_weight=0.5)
-    algo3(queries, index_path=INDEX_PATH, fusion_method='rrf', runs=['run_1.res', 'run_2.res'],
+    run_1 = algo1(queries, index_path=INDEX_PATH, k1=0.9, b=0.4, fb_terms=26, fb_docs=30, original_query_weight=0.7,
+                  model_path='lambdamart_run_1.txt')
+    run_2 = algo2(queries, index_path=INDEX_PATH, output_file='run_2.res', mu=800, fb_terms=50, fb_docs=20,
+                  original_query_weight=0.7, hybrid_weight=0.5, model_path='lambdamart_run_2.txt')
+    algo3(queries, index_path=INDEX_PATH, fusion_method='rrf', runs=[run_1, run_2],
           output_file='run_3.res', fusion_k=90, k1=0.9, b=0.2)
 if __name__ == '__main__':
     main()
\ No newline at end of file
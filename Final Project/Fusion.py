@@ -0,0 +1,101 @@
+import numpy as np
+from Runs import Run
+
+NORMALIZATIONS = ('minmax', 'zscore', 'sum', 'none')
+METHODS = ('rrf', 'combsum', 'combmnz')
+
+
+def normalize(scores, normalization='minmax'):
+    """
+    Normalize the scores of one hit list as a float64 array:
+        minmax: (score - min) / (max - min), 0 when all scores are equal.
+        zscore: (score - mean) / std, 0 when all scores are equal.
+        sum: score / sum of the scores (meant for non-negative scores), 0 when the sum is 0.
+        none: the raw scores.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if normalization not in NORMALIZATIONS:
+        raise ValueError(f"Unknown normalization '{normalization}', expected one of {NORMALIZATIONS}")
+    if normalization == 'none' or not len(scores):
+        return scores
+    if normalization == 'minmax':
+        low, high = scores.min(), scores.max()
+        return (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+    if normalization == 'zscore':
+        std = scores.std()
+        return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    total = scores.sum()
+    return scores / total if total != 0 else np.zeros_like(scores)
+
+
+def fuse_hit_lists(doc_id_lists, score_lists, weights=None, normalization='minmax', method='combsum',
+                   rank_lists=None, rrf_k=60):
+    """
+    Fuse the hit lists of one query, aligned by interned doc id:
+        rrf: sum of weight / (rrf_k + rank) over the lists, the rank of a hit being its
+            position in the list (from 1) unless rank_lists is given.
+        combsum: every list is normalized, multiplied by its weight, and the weighted
+            scores of a document are summed.
+        combmnz: combsum times the number of lists that retrieved the document.
+
+    Returns:
+        (np.ndarray, np.ndarray): The distinct doc ids (sorted) and their fused scores.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {METHODS}")
+    weights = weights if weights is not None else [1.0] * len(doc_id_lists)
+    if not doc_id_lists:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+    doc_ids = np.concatenate([np.asarray(doc_id_list, dtype=np.int32) for doc_id_list in doc_id_lists])
+    if method == 'rrf':
+        if rank_lists is None:
+            rank_lists = [np.arange(1, len(doc_id_list) + 1) for doc_id_list in doc_id_lists]
+        weighted_scores = np.concatenate([weight / (rrf_k + np.asarray(ranks, dtype=np.float64))
+                                          for weight, ranks in zip(weights, rank_lists)])
+    else:
+        weighted_scores = np.concatenate([weight * normalize(scores, normalization)
+                                          for weight, scores in zip(weights, score_lists)])
+    docs, inverse = np.unique(doc_ids, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    fused_scores = np.bincount(inverse, weights=weighted_scores, minlength=len(docs))
+    if method == 'combmnz':
+        fused_scores *= np.bincount(inverse, minlength=len(docs))
+    return docs, fused_scores
+
+
+def fuse_runs(runs, weights=None, normalization='minmax', method='combsum', k=None, tag='fused', rrf_k=60):
+    """
+    Fuse several runs query by query with fuse_hit_lists.
+
+    Parameters:
+        runs (list): Run objects; their doc ids are aligned through the DocnoTable of the first run.
+        weights (list, optional): Weight of every run, 1 by default.
+        normalization (str): 'minmax', 'zscore', 'sum' or 'none' (not used by rrf).
+        method (str): 'rrf', 'combsum' or 'combmnz'.
+        k (int, optional): Number of documents kept per query, all by default.
+        tag (str): Tag of the fused run.
+        rrf_k (int): The k constant of rrf.
+
+    Returns:
+        Run: The fused run, with the queries in order of first appearance in the runs.
+    """
+    if not runs:
+        raise ValueError("No runs to fuse")
+    weights = weights if weights is not None else [1.0] * len(runs)
+    docnos = runs[0].docnos
+    query_ids = []
+    hit_lists = {}  # query_id -> [(weight, doc ids, scores, ranks)] of the runs that have the query
+    for run, weight in zip(runs, weights):
+        run = run.remap(docnos)
+        for i, (query_id, doc_ids, scores) in enumerate(run.iter_queries()):
+            if query_id not in hit_lists:
+                hit_lists[query_id] = []
+                query_ids.append(query_id)
+            hit_lists[query_id].append((weight, doc_ids, scores, run.ranks[run.offsets[i]:run.offsets[i + 1]]))
+
+    def query_scores():
+        for query_id in query_ids:
+            query_weights, doc_id_lists, score_lists, rank_lists = zip(*hit_lists[query_id])
+            yield (query_id, *fuse_hit_lists(doc_id_lists, score_lists, query_weights, normalization, method,
+                                             rank_lists, rrf_k))
+    return Run.from_query_scores(query_scores(), docnos, tag=tag, k=k)
@@ -1,13 +1,19 @@
+import hashlib
+import json
+import os
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
+from RetrievalCache import DocnoTable
+from Runs import Run
 
 # Constants
 QUERIES_PATH = r'files/queriesROBUST.txt'
 INDEX_PATH = r'RobustPyserini'
 QRELS_PATH = r'files/qrels_50_Queries'
-MODEL_PATH = 'lambdamart_model.pkl'
 PREDICTION_OUTPUT = 'lambdamart_predictions.res'
+# Columns of a scores DataFrame that are not features
+ID_COLUMNS = ["query_id", "doc_id", "relevance"]
 
 
 def load_qrels(qrels_path):
@@ -35,51 +41,102 @@ def get_queries_list(queries_path):
             queries.append((query_id, query_text))
     return queries
 
+def read_table(path, names, dtype):
+    """
+    Read a whitespace separated file into typed columns (an empty frame for an empty file).
+    """
+    try:
+        return pd.read_csv(path, sep=r'\s+', header=None, names=names, dtype=dtype)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame({name: pd.Series(dtype=dtype.get(name, object)) for name in names})
+
+
+def read_qrels_columns(qrels_path):
+    """
+    Qrels as a DataFrame with query_id, doc_id and relevance columns.
+    """
+    qrels = read_table(qrels_path, ['query_id', 'iteration', 'doc_id', 'relevance'],
+                       {'query_id': str, 'iteration': str, 'doc_id': str, 'relevance': np.int64})
+    # a later judgment of the same pair wins, as in load_qrels
+    return qrels.drop_duplicates(['query_id', 'doc_id'], keep='last')
+
+
+def read_run_columns(run):
+    """
+    (query ids, doc ids, ranks, scores) arrays of a Run, or of a (run_file_path, run_name) TREC file.
+    """
+    if isinstance(run, Run):
+        query_ids = np.array(run.query_ids, dtype=object)[run.queries]
+        doc_ids = np.array(run.docnos.lookup(run.doc_ids), dtype=object)
+        return query_ids, doc_ids, np.asarray(run.ranks, dtype=np.int64), np.asarray(run.scores, dtype=np.float64)
+    columns = read_table(run[0], ['query_id', 'q0', 'doc_id', 'rank', 'score', 'tag'],
+                         {'query_id': str, 'q0': str, 'doc_id': str, 'rank': np.int64, 'score': np.float64, 'tag': str})
+    return (columns['query_id'].to_numpy(dtype=object), columns['doc_id'].to_numpy(dtype=object),
+            columns['rank'].to_numpy(), columns['score'].to_numpy())
+
+
 def read_scores_from_files(run_files, qrels_path=QRELS_PATH):
     """
     Read scores and relevance data from multiple run files into a single DataFrame.
     Each run file contributes its score and rank as separate columns.
 
+    The runs are parsed into typed arrays and outer-joined on (query_id, doc_id): the pairs
+    of all runs are hashed once (pd.factorize) into row numbers, and every run scatters its
+    scores and ranks into its columns (NaN where the run did not retrieve the document).
+    Rows are grouped by query, in order of first appearance. Relevance labels are looked up
+    for all rows at once on a MultiIndex of the qrels.
+
     Parameters:
-        run_files (list): List of tuples where each tuple contains (run_file_path, run_name).
+        run_files (list): List of Run objects (named by their tag), or of tuples (run_file_path, run_name).
                           The run_name is used for column naming.
         qrels_path (str): Path to the qrels file.
 
     Returns:
         pd.DataFrame: A combined DataFrame with scores, ranks, and relevance for each document.
     """
-    qrels = load_qrels(qrels_path)
-
-    # Parse all run files into a dictionary for quick lookups
-    run_data = {}
-    for run_file, run_name in run_files:
-        with open(run_file, 'r') as f:
-            for line in f:
-                query_id, _, doc_id, rank, score, _ = line.strip().split()
-                if query_id not in run_data:
-                    run_data[query_id] = {}
-                if doc_id not in run_data[query_id]:
-                    run_data[query_id][doc_id] = {}
-                run_data[query_id][doc_id][f'{run_name}_score'] = float(score)
-                run_data[query_id][doc_id][f'{run_name}_rank'] = int(rank)
-
-    data = []  # Use a list to collect rows
-
-    # Iterate over all entries in the first run file to form the base DataFrame
-    primary_run = run_files[0][1]
-    for query_id, docs in run_data.items():
-        for doc_id, doc_scores in docs.items():
-            # Combine scores and ranks from all runs
-            row = {
-                'query_id': query_id,
-                'doc_id': doc_id,
-                'relevance': qrels.get(query_id, {}).get(doc_id, 0)
-            }
-            row.update(doc_scores)
-            data.append(row)
-
-    # Convert the list of dictionaries to a DataFrame
-    df = pd.DataFrame(data)
+    runs = []
+    for run in run_files:
+        run_name = run.tag if isinstance(run, Run) else run[1]
+        runs.append((run_name, *read_run_columns(run)))
+    if not runs or not sum(len(run[1]) for run in runs):
+        return pd.DataFrame(columns=ID_COLUMNS)
+
+    # Hash join of all runs on (query_id, doc_id)
+    query_codes, query_ids = pd.factorize(np.concatenate([run[1] for run in runs]))
+    doc_codes, doc_ids = pd.factorize(np.concatenate([run[2] for run in runs]))
+    pair_rows, pairs = pd.factorize(query_codes.astype(np.int64) * len(doc_ids) + doc_codes)
+    # group the rows by query, keeping the order of first appearance within a query
+    order = np.argsort(pairs // len(doc_ids), kind='stable')
+    pairs = pairs[order]
+    new_rows = np.empty(len(order), dtype=np.int64)
+    new_rows[order] = np.arange(len(order))
+    pair_rows = new_rows[pair_rows]
+
+    df = pd.DataFrame({'query_id': query_ids[pairs // len(doc_ids)], 'doc_id': doc_ids[pairs % len(doc_ids)]})
+
+    # Vectorized qrels lookup
+    qrels = read_qrels_columns(qrels_path)
+    qrels_index = pd.MultiIndex.from_arrays([qrels['query_id'], qrels['doc_id']])
+    positions = qrels_index.get_indexer(pd.MultiIndex.from_arrays([df['query_id'], df['doc_id']]))
+    relevance = qrels['relevance'].to_numpy()
+    df['relevance'] = np.where(positions >= 0, relevance[positions] if len(relevance) else 0, 0)
+
+    # Scatter the scores and ranks of every run into its columns
+    columns = {}
+    start = 0
+    for run_name, _, _, ranks, scores in runs:
+        rows = pair_rows[start:start + len(ranks)]
+        start += len(ranks)
+        if f'{run_name}_score' not in columns:
+            columns[f'{run_name}_score'] = np.full(len(df), np.nan)
+            columns[f'{run_name}_rank'] = np.full(len(df), np.nan)
+        columns[f'{run_name}_score'][rows] = scores
+        columns[f'{run_name}_rank'][rows] = ranks
+    for name, values in columns.items():
+        # ranks stay integers when the run retrieved every document
+        if name.endswith('_rank') and not np.isnan(values).any():
+            values = values.astype(np.int64)
+        df[name] = values
 
     return df
 
@@ -139,17 +196,34 @@ def predict_and_rerank(test_df, model, output_file):
 
     print(f"Predictions saved to {output_file}")
 
-def train_reranker(run_files=[('run_1.res','bm25')]):
+def train_reranker(run_files=[('run_1.res','bm25')], model_path=None, feature_extractor=None, queries=None,
+                   fingerprint=None):
+    """
+    Train a LambdaMART ranker on the scores of the given runs.
+
+    Parameters:
+        run_files (list): Runs, see read_scores_from_files.
+        model_path (str, optional): Save the trained model there (see save_model).
+        feature_extractor (Features.FeatureExtractor, optional): Adds index-derived features to the run scores.
+        queries (list, optional): List of tuples (query_id, query_text), needed with a feature_extractor.
+        fingerprint (str, optional): Training fingerprint saved with the model (see training_fingerprint).
+
+    Returns:
+        lgb.LGBMRanker: The trained model.
+    """
     bm_df = read_scores_from_files(run_files)
+    if feature_extractor is not None:
+        bm_df = feature_extractor.add_features(bm_df, queries)
     train_df, validation_df = split_train_val_by_query(bm_df, random_state=42)
 
     qids_train = train_df.groupby("query_id")["query_id"].count().to_numpy()
-    X_train = train_df.drop(["query_id", "doc_id", "relevance"], axis=1)
+    # the column names are the feature names stored in the model
+    X_train = train_df.drop(ID_COLUMNS, axis=1)
     y_train = train_df["relevance"]
 
 
     qids_validation = validation_df.groupby("query_id")["query_id"].count().to_numpy()
-    X_validation = validation_df.drop(["query_id", "doc_id", "relevance"], axis=1)
+    X_validation = validation_df.drop(ID_COLUMNS, axis=1)
     y_validation = validation_df["relevance"]
 
     model = lgb.LGBMRanker(
@@ -165,38 +239,152 @@ def train_reranker(run_files=[('run_1.res','bm25')]):
         eval_group=[qids_validation]
     )
 
+    if model_path:
+        save_model(model, model_path, fingerprint)
+    return model
+
+def training_fingerprint(config, qrels_path=QRELS_PATH):
+    """
+    Hash of a training configuration (a JSON serializable dict: retrieval parameters,
+    training queries, index fingerprint) and of the qrels the labels are read from.
+    """
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8'))
+    with open(qrels_path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def model_info_path(model_path):
+    # training fingerprint of a saved model, next to the model file
+    return f"{model_path}.json"
+
+
+def save_model(model, model_path, fingerprint=None):
+    """
+    Save a trained LGBMRanker (or Booster) in the LightGBM text model format, which keeps
+    the names of the features in training order, and its training fingerprint in
+    <model_path>.json.
+    """
+    booster = model.booster_ if isinstance(model, lgb.LGBMModel) else model
+    booster.save_model(model_path)
+    with open(model_info_path(model_path), 'w') as f:
+        json.dump({'fingerprint': fingerprint}, f)
+    print(f"Model saved to {model_path}")
+
+
+def feature_columns(df):
+    """
+    The feature columns of a scores DataFrame: every column except the ids (and an earlier
+    prediction), in column order.
+    """
+    return [column for column in df.columns if column not in ID_COLUMNS + ["predicted_score"]]
+
+
+def load_reranker(model_path, feature_names, fingerprint=None, threads=0):
+    """
+    The saved model at model_path if it was trained on exactly these features, in this
+    order, and with this training fingerprint (see training_fingerprint), else None (no
+    file, a model of other runs or another feature set, or trained with other retrieval
+    parameters, queries or qrels).
+    """
+    if not model_path or not os.path.exists(model_path):
+        return None
+    saved = None
+    if os.path.exists(model_info_path(model_path)):
+        with open(model_info_path(model_path), 'r') as f:
+            saved = json.load(f).get('fingerprint')
+    if saved != fingerprint:
+        print(f"Ignoring {model_path}: trained with another configuration or qrels")
+        return None
+    model = RerankerModel.load(model_path, threads)
+    if model.feature_names != list(feature_names):
+        print(f"Ignoring {model_path}: trained on features {model.feature_names}, expected {list(feature_names)}")
+        return None
     return model
 
-def load_model_and_predict(model, test_df, output_file):
+
+class RerankerModel:
+    """
+    Load-once LambdaMART scorer that predicts straight from a C-contiguous float32 feature
+    matrix (one row per candidate, the feature columns in training order), which LightGBM
+    reads without converting or copying.
+
+    predict() scores a whole batch with all threads; predict_query() scores the candidates
+    of a single query on one thread, which avoids the cost of starting the OpenMP threads
+    for a few hundred rows.
+    """
+    def __init__(self, booster, threads=0):
+        self.booster = booster
+        self.num_features = booster.num_feature()
+        self.feature_names = booster.feature_name()
+        self.threads = threads  # 0: LightGBM's default (all cores)
+
+    @classmethod
+    def load(cls, model_path, threads=0):
+        return cls(lgb.Booster(model_file=model_path), threads)
+
+    @classmethod
+    def from_model(cls, model, threads=0):
+        """
+        Wrap a trained LGBMRanker (or Booster) without saving it.
+        """
+        if isinstance(model, cls):
+            return model
+        return cls(model.booster_ if isinstance(model, lgb.LGBMModel) else model, threads)
+
+    def features(self, df):
+        """
+        The feature matrix of a scores DataFrame (see feature_columns), whose columns must be
+        the features the model was trained on, in the same order.
+        """
+        columns = feature_columns(df)
+        if columns != self.feature_names:
+            raise ValueError(f"Model trained on features {self.feature_names}, got {columns}")
+        return np.ascontiguousarray(df[columns].to_numpy(dtype=np.float32))
+
+    def predict(self, features):
+        """
+        Scores of a batch of candidates, possibly of many queries.
+        """
+        return self.booster.predict(features, num_threads=self.threads)
+
+    def predict_query(self, features):
+        """
+        Scores of the candidates of a single query.
+        """
+        return self.booster.predict(features, num_threads=1)
+
+
+def load_model_and_predict(model, test_df, output_file=None, docnos=None):
     """
-    Load a saved LightGBM model, predict scores for test data, and save reranked results in TREC format.
+    Predict scores for test data with a LambdaMART model and rerank the documents of every query.
 
     Parameters:
+        model (lgb.LGBMRanker or RerankerModel): The trained model (see train_reranker and load_reranker).
         test_df (pd.DataFrame): The test DataFrame containing features and query/document identifiers.
-        model_path (str): Path to the saved LightGBM model file.
-        output_file (str): Path to save the TREC-formatted reranked results.
+        output_file (str, optional): Path to export the reranked results in TREC format.
+        docnos (DocnoTable, optional): Table to intern the doc ids of the reranked run into.
 
     Returns:
-        None
+        Run: The reranked results.
     """
+    if model is None:
+        raise ValueError("No reranking model, train one with train_reranker or load one with load_reranker")
+    model = RerankerModel.from_model(model)
 
-    # Prepare test data
-    X_test = test_df.drop(["query_id", "doc_id", "relevance"], axis=1)
+    # Prepare test data and generate predictions
+    predicted_scores = model.predict(model.features(test_df))
+    test_df["predicted_score"] = predicted_scores
 
-    # Generate predictions
-    test_df["predicted_score"] = model.predict(X_test)
-
-    # Group by query_id and rerank based on predicted scores
-    reranked_results = []
-    for query_id, group in test_df.groupby("query_id"):
-        group = group.sort_values(by="predicted_score", ascending=False)
-        for rank, (_, row) in enumerate(group.iterrows(), start=1):
-            reranked_results.append(
-                f"{query_id} Q0 {row['doc_id']} {rank} {row['predicted_score']:.6f} {output_file[:-4]}"
-            )
+    # Rerank every query by the predicted scores
+    docnos = docnos if docnos is not None else DocnoTable()
+    doc_ids = docnos.intern_many(test_df["doc_id"].tolist())
+    query_scores = [(query_id, doc_ids[rows], predicted_scores[rows])
+                    for query_id, rows in test_df.groupby("query_id").indices.items()]
+    run = Run.from_query_scores(query_scores, docnos, tag=output_file[:-4] if output_file else 'reranked')
 
     # Save reranked results in TREC format
-    with open(output_file, "w") as f:
-        f.write("\n".join(reranked_results) + "\n")
-
-    print(f"Predictions saved to {output_file}")
+    if output_file:
+        run.to_trec(output_file)
+        print(f"Predictions saved to {output_file}")
+    return run
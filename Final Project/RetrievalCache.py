@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+CACHE_DIR = '.retrieval_cache'
+
+
+def index_fingerprint(index_path):
+    """
+    Hash of the name, size and modification time of every file of a Lucene index.
+    Lucene writes new segment files whenever the index changes, so any rebuild or update
+    gives a new fingerprint.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(index_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, index_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class DocnoTable:
+    """
+    Interns document names (docnos) into dense integer ids, so cache entries and runs
+    store 4 byte ids instead of strings. New docnos are appended to a text file,
+    one per line, so the ids stay the same across executions.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.ids = {}  # docno -> id
+        self.docnos = []  # id -> docno
+        if path is not None and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self.ids[line.rstrip('\n')] = len(self.docnos)
+                    self.docnos.append(line.rstrip('\n'))
+
+    def __len__(self):
+        return len(self.docnos)
+
+    def intern_many(self, docnos):
+        """
+        The ids of a list of docnos as an int32 array, adding the unknown ones.
+        """
+        ids = np.empty(len(docnos), dtype=np.int32)
+        new_docnos = []
+        for i, docno in enumerate(docnos):
+            doc_id = self.ids.get(docno)
+            if doc_id is None:
+                doc_id = len(self.docnos)
+                self.ids[docno] = doc_id
+                self.docnos.append(docno)
+                new_docnos.append(docno)
+            ids[i] = doc_id
+        if new_docnos and self.path is not None:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{docno}\n" for docno in new_docnos))
+        return ids
+
+    def lookup(self, doc_ids):
+        """
+        The docnos of an array of ids.
+        """
+        docnos = self.docnos
+        return [docnos[doc_id] for doc_id in doc_ids.tolist()]
+
+
+class RetrievalCache:
+    """
+    Disk cache of first-stage hit lists, so reranking and fusion settings can be tuned
+    without running Lucene again.
+
+    Entries live under <cache_dir>/<hash of the index path>/<index fingerprint>/, one
+    .npz file per (ranking config, query text, k) holding the interned doc ids (int32)
+    and the scores (float32, the precision Lucene scores with). When the index changes
+    its fingerprint changes, and the entries of the old fingerprint are deleted.
+    """
+    def __init__(self, index_path, cache_dir=CACHE_DIR):
+        index_key = hashlib.sha1(os.path.abspath(index_path).encode('utf-8')).hexdigest()[:16]
+        index_dir = os.path.join(cache_dir, index_key)
+        fingerprint = index_fingerprint(index_path)
+        if os.path.isdir(index_dir):
+            for name in os.listdir(index_dir):
+                if name != fingerprint:  # stale entries of an older version of the index
+                    shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+        self.directory = os.path.join(index_dir, fingerprint)
+        os.makedirs(self.directory, exist_ok=True)
+        self.docnos = DocnoTable(os.path.join(self.directory, 'docnos.txt'))
+
+    def entry_path(self, config, query_text, k):
+        key = json.dumps([config, query_text, k], sort_keys=True)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.npz")
+
+    def get(self, config, query_text, k):
+        """
+        The cached (doc ids, scores) arrays of a query, or None on a miss.
+        The doc ids are ids of self.docnos.
+        """
+        path = self.entry_path(config, query_text, k)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as entry:
+            return entry['doc_ids'], entry['scores']
+
+    def put(self, config, query_text, k, doc_ids, scores):
+        path = self.entry_path(config, query_text, k)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so an interrupted run never leaves a truncated entry
+        temp_path = f"{path[:-4]}.tmp.npz"
+        np.savez(temp_path, doc_ids=np.asarray(doc_ids, dtype=np.int32), scores=np.asarray(scores, dtype=np.float32))
+        os.replace(temp_path, path)
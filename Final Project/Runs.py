@@ -0,0 +1,173 @@
+import json
+import os
+from collections import namedtuple
+import numpy as np
+from RetrievalCache import DocnoTable
+
+# A single hit of a run, with the docid and score attributes of a pyserini hit
+Hit = namedtuple('Hit', ['docid', 'score'])
+
+
+def top_k_order(scores, k=None):
+    """
+    Positions of the k highest scores, best first, equal scores in the given order: the
+    same as np.argsort(-scores, kind='stable')[:k], but only the k selected scores are
+    sorted (np.argpartition finds the k-th score).
+    """
+    scores = np.asarray(scores)
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    # the first of the scores equal to the k-th one fill the remaining places
+    selected = np.concatenate([above, np.flatnonzero(scores == threshold)[:k - len(above)]])
+    selected.sort()
+    return selected[np.argsort(-scores[selected], kind='stable')]
+
+
+class Run:
+    """
+    A TREC run held as parallel NumPy arrays, so pipeline stages hand runs to each other
+    in memory instead of writing and parsing TREC text files.
+
+    Rows are grouped by query (in the order of query_ids) and ordered by rank within a query:
+        queries (int32): index of the row's query in query_ids.
+        doc_ids (int32): interned doc id, docnos.docnos[doc_id] is the document name.
+        ranks (int32): rank of the document for the query, from 1.
+        scores (float64): score of the document.
+    offsets[i]:offsets[i + 1] are the rows of query_ids[i].
+    """
+    def __init__(self, query_ids, queries, doc_ids, ranks, scores, docnos, tag='run'):
+        self.query_ids = list(query_ids)
+        self.queries = queries
+        self.doc_ids = doc_ids
+        self.ranks = ranks
+        self.scores = scores
+        self.docnos = docnos
+        self.tag = tag
+        self.offsets = np.searchsorted(queries, np.arange(len(self.query_ids) + 1))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_query_scores(cls, query_scores, docnos, tag='run', k=None):
+        """
+        Build a run from (query_id, doc_ids, scores) of every query. The documents of a
+        query are sorted by descending score (keeping the given order of equal scores),
+        ranked from 1 and cut to the k best.
+        """
+        query_ids = []
+        columns = []
+        for query_id, doc_ids, scores in query_scores:
+            doc_ids = np.asarray(doc_ids, dtype=np.int32)
+            scores = np.asarray(scores, dtype=np.float64)
+            order = top_k_order(scores, k)
+            columns.append((np.full(len(order), len(query_ids), dtype=np.int32), doc_ids[order], scores[order],
+                            np.arange(1, len(order) + 1, dtype=np.int32)))
+            query_ids.append(query_id)
+        if not columns:
+            empty_ints = np.empty(0, dtype=np.int32)
+            return cls([], empty_ints, empty_ints, empty_ints, np.empty(0, dtype=np.float64), docnos, tag)
+        queries, doc_ids, scores, ranks = (np.concatenate(column) for column in zip(*columns))
+        return cls(query_ids, queries, doc_ids, ranks, scores, docnos, tag)
+
+    def iter_queries(self):
+        """
+        Yields (query_id, doc_ids, scores) of every query, as views of the run's arrays.
+        """
+        for i, query_id in enumerate(self.query_ids):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            yield query_id, self.doc_ids[start:end], self.scores[start:end]
+
+    def rows(self):
+        """
+        Yields (query_id, docno, rank, score) of every row, the fields of a TREC run line.
+        """
+        for i, query_id in enumerate(self.query_ids):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            docnos = self.docnos.lookup(self.doc_ids[start:end])
+            yield from zip([query_id] * len(docnos), docnos, self.ranks[start:end].tolist(),
+                           self.scores[start:end].tolist())
+
+    def hits(self):
+        """
+        query_id -> list of Hit (interned doc id, score), for code working on hit lists.
+        """
+        return {query_id: [Hit(doc_id, score) for doc_id, score in zip(doc_ids.tolist(), scores.tolist())]
+                for query_id, doc_ids, scores in self.iter_queries()}
+
+    def remap(self, docnos):
+        """
+        The same run with doc ids interned in another DocnoTable, so runs built with
+        different tables can be combined.
+        """
+        if docnos is self.docnos:
+            return self
+        used, inverse = np.unique(self.doc_ids, return_inverse=True)
+        doc_ids = docnos.intern_many(self.docnos.lookup(used))[inverse.reshape(-1)]
+        return Run(self.query_ids, self.queries, doc_ids, self.ranks, self.scores, docnos, self.tag)
+
+    def to_trec(self, output_file, tag=None):
+        """
+        Export the run as a TREC run file.
+        """
+        tag = tag or self.tag
+        with open(output_file, 'w') as f:
+            f.writelines(f"{query_id} Q0 {docno} {rank} {score:.6f} {tag}\n"
+                         for query_id, docno, rank, score in self.rows())
+
+    @classmethod
+    def read_trec(cls, run_file, docnos=None, tag=None):
+        """
+        Read a TREC run file, interning its docnos into `docnos` (a new DocnoTable by default).
+        """
+        docnos = docnos if docnos is not None else DocnoTable()
+        query_index = {}
+        queries, names, ranks, scores = [], [], [], []
+        with open(run_file, 'r') as f:
+            for line in f:
+                query_id, _, docno, rank, score, run_tag = line.split()
+                queries.append(query_index.setdefault(query_id, len(query_index)))
+                names.append(docno)
+                ranks.append(int(rank))
+                scores.append(float(score))
+                tag = tag or run_tag
+        queries = np.array(queries, dtype=np.int32)
+        order = np.argsort(queries, kind='stable')  # group the queries, in order of first appearance
+        return cls(list(query_index), queries[order], docnos.intern_many(names)[order],
+                   np.array(ranks, dtype=np.int32)[order], np.array(scores, dtype=np.float64)[order],
+                   docnos, tag or 'run')
+
+    def save(self, path):
+        """
+        Save the run as a directory of .npy files, which load() memory-maps.
+        Only the docnos the run uses are saved, with the doc ids renumbered.
+        """
+        os.makedirs(path, exist_ok=True)
+        used, doc_ids = np.unique(self.doc_ids, return_inverse=True)
+        np.save(os.path.join(path, 'queries.npy'), self.queries)
+        np.save(os.path.join(path, 'doc_ids.npy'), doc_ids.astype(np.int32))
+        np.save(os.path.join(path, 'ranks.npy'), self.ranks)
+        np.save(os.path.join(path, 'scores.npy'), self.scores)
+        np.save(os.path.join(path, 'docnos.npy'), np.array(self.docnos.lookup(used), dtype=str))
+        with open(os.path.join(path, 'run.json'), 'w') as f:
+            json.dump({'tag': self.tag, 'query_ids': self.query_ids}, f)
+
+    @classmethod
+    def load(cls, path, docnos=None, mmap=True):
+        """
+        Load a run saved by save(), memory-mapping its arrays unless mmap is False.
+        Its docnos are interned into `docnos` when given.
+        """
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, 'run.json'), 'r') as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ('queries', 'doc_ids', 'ranks', 'scores')]
+        table = DocnoTable()
+        table.intern_many(np.load(os.path.join(path, 'docnos.npy')).tolist())
+        run = cls(meta['query_ids'], *arrays, docnos=table, tag=meta['tag'])
+        return run.remap(docnos) if docnos is not None else run
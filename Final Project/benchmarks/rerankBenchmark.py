@@ -0,0 +1,116 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Reranker import RerankerModel, save_model
+
+PERCENTILES = [50, 90, 99]
+# kept apart from the models of the pipeline, which must never load the synthetic one
+DEFAULT_MODEL = os.path.join(tempfile.gettempdir(), "rerank_benchmark_model.txt")
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+def latency_stats(latencies):
+    latencies = sorted(latencies)
+    stats = {"queries": len(latencies), "mean_ms": sum(latencies) / len(latencies), "max_ms": latencies[-1]}
+    for p in PERCENTILES:
+        stats[f"p{p}_ms"] = percentile(latencies, p)
+    return stats
+
+
+def train_synthetic_model(num_features, candidates, rng, num_queries=50):
+    """
+    LambdaMART model trained on random features, with labels that depend on the first feature.
+    """
+    X = rng.random((num_queries * candidates, num_features), dtype=np.float32)
+    y = np.minimum((X[:, 0] * 3 + rng.random(len(X)) * 0.5).astype(int), 2)
+    model = lgb.LGBMRanker(objective="lambdarank", metric="ndcg", verbose=-1)
+    model.fit(X, y, group=[candidates] * num_queries)
+    return model
+
+
+def time_queries(predict, matrices):
+    for features in matrices[:10]:
+        predict(features) # warm up
+    latencies = []
+    for features in matrices:
+        start = time.perf_counter()
+        predict(features)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latency_stats(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-query LambdaMART rerank latency.")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="saved model; a synthetic one is trained and saved if missing")
+    parser.add_argument("--features", type=int, default=4, help="features of the synthetic model")
+    parser.add_argument("--candidates", type=int, default=1000, help="candidates per query")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=0, help="threads of the batch mode (0: all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="rerank_benchmark.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if not os.path.exists(args.model):
+        save_model(train_synthetic_model(args.features, args.candidates, rng), args.model)
+
+    start = time.perf_counter()
+    model = RerankerModel.load(args.model, threads=args.threads)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    matrices = [np.ascontiguousarray(rng.random((args.candidates, model.num_features), dtype=np.float32))
+                for _ in range(args.queries)]
+    single_query = time_queries(model.predict_query, matrices)
+    batch_thread = time_queries(model.predict, matrices)
+    # the previous path: a DataFrame converted by LightGBM on every call
+    frames = [pd.DataFrame(features.astype(np.float64)) for features in matrices]
+    dataframe = time_queries(model.booster.predict, frames)
+
+    batch = np.concatenate(matrices)
+    start = time.perf_counter()
+    model.predict(batch)
+    batch_seconds = time.perf_counter() - start
+
+    for name, result in (("single query", single_query), ("multi-threaded", batch_thread), ("DataFrame", dataframe)):
+        print(f"{name:<15} " + ", ".join(f"p{p} {result[f'p{p}_ms']:.3f} ms" for p in PERCENTILES))
+    print(f"batch of {args.queries} queries: {batch_seconds * 1000:.1f} ms, {len(batch) / batch_seconds:.0f} candidates/sec")
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "lightgbm": lgb.__version__,
+            "args": vars(args),
+        },
+        "load_ms": load_ms,
+        "num_features": model.num_features,
+        "single_query": single_query,
+        "multi_threaded_query": batch_thread,
+        "dataframe_query": dataframe,
+        "batch": {"queries": args.queries, "seconds": batch_seconds, "candidates_per_sec": len(batch) / batch_seconds},
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
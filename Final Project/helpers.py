@@ -1,5 +1,13 @@
+import os
 from pyserini.analysis import Analyzer, get_lucene_analyzer
 from pyserini.search.lucene import LuceneSearcher, LuceneFusionSearcher
+from RetrievalCache import DocnoTable, RetrievalCache
+from Runs import Run
+
+# Number of Lucene search threads used by batch_search
+THREADS = os.cpu_count() or 1
+# Lucene analyzer of every searcher, part of the retrieval cache key
+ANALYZER = {'stemmer': 'krovetz', 'stopwords': False}
 
 def normalize_scores(hits):
     if not hits:  # Handle empty results
@@ -27,17 +35,94 @@ def get_queries_list(queries_path):
                     queries.append((query_id, query_text))
         return queries
 
-def plain_bm25(queries, index_path, output_file='bm25.res', k1=0.9, b=0.4):
+def batch_search(searcher, queries, k=1000, threads=THREADS):
     """
-    Plain BM25 without RM3 - for algo3
+    Retrieve the hits of all queries with a single multi-threaded Lucene batch search.
+
+    Parameters:
+        searcher (LuceneSearcher): Configured searcher (analyzer, similarity, RM3).
+        queries (list): List of tuples (query_id, query_text).
+        k (int): Number of hits per query.
+        threads (int): Number of search threads.
+
+    Returns:
+        dict: query_id -> list of hits, best first (empty for queries without hits).
+    """
+    if not queries:
+        return {}
+    query_ids = [query_id for query_id, _ in queries]
+    query_texts = [query_text for _, query_text in queries]
+    hits = searcher.batch_search(query_texts, query_ids, k=k, threads=threads)
+    return {query_id: hits.get(query_id, []) for query_id in query_ids}
+
+def make_searcher(index_path, bm25=None, qld=None, rm3=None):
+    """
+    LuceneSearcher with the project's analyzer, BM25 (dict of k1, b) or QLD (dict of mu)
+    scoring, and optional RM3 expansion (dict of fb_terms, fb_docs, original_query_weight).
     """
     searcher = LuceneSearcher(index_path)
-    analyzer = get_lucene_analyzer(stemmer='krovetz', stopwords=False)
-    searcher.set_analyzer(analyzer)
-    searcher.set_bm25(k1=k1, b=b)
-    with open(output_file, 'w') as f:
-        for query in queries:
-            hits = searcher.search(query[1], k=1000)
-            # hits = normalize_scores(hits)
-            for i, hit in enumerate(hits):
-                f.write(f"{query[0]} Q0 {hit.docid:<17} {i+1:<4} {hit.score:<20.6f} run_bm25\n")
\ No newline at end of file
+    searcher.set_analyzer(get_lucene_analyzer(**ANALYZER))
+    if bm25 is not None:
+        searcher.set_bm25(**bm25)
+    if qld is not None:
+        searcher.set_qld(**qld)
+    if rm3 is not None:
+        searcher.set_rm3(**rm3)
+    return searcher
+
+_caches = {}
+_docnos = {}
+
+def retrieve(queries, index_path, k=1000, threads=THREADS, bm25=None, qld=None, rm3=None, use_cache=True, tag='run'):
+    """
+    First-stage retrieval through the on-disk RetrievalCache: cached queries are read
+    back, only the missing ones are sent to a batch search, and their hits are cached.
+
+    Parameters:
+        queries (list): List of tuples (query_id, query_text).
+        index_path (str): Path to the Lucene index.
+        k (int): Number of hits per query.
+        threads (int): Number of search threads for the missing queries.
+        bm25, qld, rm3 (dict): Ranking configuration, see make_searcher.
+        use_cache (bool): Read and write the cache.
+        tag (str): Tag of the returned run.
+
+    Returns:
+        Run: The hits of every query, best first, with doc ids interned in a DocnoTable
+             shared by all runs of the index.
+    """
+    config = {'analyzer': ANALYZER, 'bm25': bm25, 'qld': qld, 'rm3': rm3}
+    cache = None
+    if use_cache:
+        if index_path not in _caches:
+            _caches[index_path] = RetrievalCache(index_path)
+        cache = _caches[index_path]
+    # cached doc ids are ids of the cache's table
+    docnos = cache.docnos if cache is not None else _docnos.setdefault(index_path, DocnoTable())
+
+    hits = {}
+    missing = []
+    for query_id, query_text in queries:
+        cached = cache.get(config, query_text, k) if cache is not None else None
+        if cached is None:
+            missing.append((query_id, query_text))
+        else:
+            hits[query_id] = cached
+    if missing:
+        searcher = make_searcher(index_path, bm25=bm25, qld=qld, rm3=rm3)
+        query_texts = dict(missing)
+        for query_id, query_hits in batch_search(searcher, missing, k=k, threads=threads).items():
+            doc_ids = docnos.intern_many([hit.docid for hit in query_hits])
+            scores = [hit.score for hit in query_hits]
+            hits[query_id] = doc_ids, scores
+            if cache is not None:
+                cache.put(config, query_texts[query_id], k, doc_ids, scores)
+    return Run.from_query_scores(((query_id, *hits[query_id]) for query_id, _ in queries), docnos, tag=tag)
+
+def plain_bm25(queries, index_path, output_file='bm25.res', k1=0.9, b=0.4, threads=THREADS):
+    """
+    Plain BM25 without RM3 - for algo3
+    """
+    run = retrieve(queries, index_path, k=1000, threads=threads, bm25={'k1': k1, 'b': b}, tag='run_bm25')
+    run.to_trec(output_file)
+    return run
\ No newline at end of file
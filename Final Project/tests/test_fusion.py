@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Algo_3 import algo3, stream_fusion
+from Fusion import METHODS, fuse_hit_lists, fuse_runs
+from RetrievalCache import DocnoTable
+from Runs import Run, top_k_order
+
+
+def make_run(docnos, queries, tag='run'):
+    """
+    A Run from {query_id: [(docno, score), ...]}.
+    """
+    return Run.from_query_scores([(query_id, docnos.intern_many([docno for docno, _ in hits]), [score for _, score in hits])
+                                  for query_id, hits in queries.items()], docnos, tag=tag)
+
+
+def test_runs_with_different_query_sets(tmp_path):
+    docnos = DocnoTable()
+    run_a = make_run(docnos, {'1': [('d1', 2.0), ('d2', 1.0)], '3': [('d5', 1.0), ('d7', 0.5)]})
+    # the second run lacks query 1, has query 2 and lists its queries in another order
+    run_b = make_run(docnos, {'3': [('d5', 4.0), ('d6', 3.0)], '2': [('d3', 1.0)]})
+    # a run file must list its queries in query order
+    run_b_file = str(tmp_path / 'run_b.res')
+    run_b.to_trec(run_b_file)
+    with pytest.raises(ValueError):
+        list(stream_fusion([run_a, run_b_file], 'rrf'))
+    make_run(docnos, {'2': [('d3', 1.0)], '3': [('d5', 4.0), ('d6', 3.0)]}).to_trec(run_b_file)
+
+    for runs in ([run_a, run_b], [run_a, run_b_file], [run_b_file, run_a]):
+        fused = list(stream_fusion(runs, 'rrf', fusion_k=100, k=None))
+        assert [query_id for query_id, _ in fused] == ['1', '2', '3']
+        hits = dict(fused)
+        assert hits['1'] == [('d1', pytest.approx(1 / 101)), ('d2', pytest.approx(1 / 102))]
+        assert hits['2'] == [('d3', pytest.approx(1 / 101))]
+        assert hits['3'][0] == ('d5', pytest.approx(2 / 101))
+        assert dict(hits['3'][1:]) == {'d6': pytest.approx(1 / 102), 'd7': pytest.approx(1 / 102)}
+
+    run = algo3([], 'combmnz', None, runs=[run_a, run_b_file], output_file=str(tmp_path / 'run_3.res'))
+    assert run.query_ids == ['1', '2', '3']
+    rows = list(run.rows())
+    assert [(query_id, docno) for query_id, docno, _, _ in rows[:4]] == [('1', 'd1'), ('1', 'd2'), ('2', 'd3'), ('3', 'd5')]
+    assert sorted(docno for query_id, docno, _, _ in rows if query_id == '3') == ['d5', 'd6', 'd7']
+    # d5 is the best document of both runs for query 3: (1 + 1) * 2 runs
+    assert rows[3][3] == pytest.approx(4.0)
+
+
+def test_fuse_hit_lists():
+    doc_id_lists = [np.array([0, 1, 2]), np.array([2, 3])]
+    score_lists = [[3.0, 2.0, 1.0], [10.0, 5.0]]
+    expected = {
+        # min-max normalized lists [1, 0.5, 0] and [1, 0], weighted by 0.5 and 1
+        'combsum': [0.5, 0.25, 1.0, 0.0],
+        'combmnz': [0.5, 0.25, 2.0, 0.0],
+        'rrf': [0.5 / 61, 0.5 / 62, 0.5 / 63 + 1 / 61, 1 / 62],
+    }
+    for method, fused in expected.items():
+        doc_ids, scores = fuse_hit_lists(doc_id_lists, score_lists, weights=[0.5, 1.0], method=method)
+        assert doc_ids.tolist() == [0, 1, 2, 3]
+        assert scores == pytest.approx(fused)
+
+
+def test_top_k_order_keeps_tied_scores_in_order():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        scores = rng.integers(0, 5, size=rng.integers(0, 40)).astype(np.float64)
+        for k in (None, 0, 1, 5, 39, 100):
+            assert top_k_order(scores, k).tolist() == np.argsort(-scores, kind='stable')[:k].tolist()
+
+
+def test_algo3_and_fuse_runs_agree(tmp_path):
+    rng = np.random.default_rng(7)
+    docnos = DocnoTable()
+    runs = []
+    for query_ids in (['401', '402', '403'], ['402', '403', '404']):
+        queries = {}
+        for query_id in query_ids:
+            docs = rng.choice(60, size=20, replace=False)
+            queries[query_id] = [(f"D{doc}", score) for doc, score in zip(docs, rng.random(20) * 10)]
+        runs.append(make_run(docnos, queries))
+    run_file = str(tmp_path / 'run_b.res')
+    runs[1].to_trec(run_file)
+
+    for method in METHODS:
+        streamed = dict(stream_fusion([runs[0], run_file], method, fusion_k=60, k=None))
+        fused = fuse_runs(runs, method=method, rrf_k=60)
+        assert sorted(fused.query_ids) == sorted(streamed)
+        for query_id, doc_ids, scores in fused.iter_queries():
+            expected = dict(zip(fused.docnos.lookup(doc_ids), scores.tolist()))
+            assert dict(streamed[query_id]) == pytest.approx(expected, abs=1e-6)